@@ -1,13 +1,17 @@
 from __future__ import annotations
 
-import secrets
+import asyncio
+import hmac
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
+from itertools import groupby
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
 
 from fastapi import Depends, FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from pydantic import TypeAdapter
 
 from claude_agent_sdk import (
     query,
@@ -18,11 +22,13 @@ from claude_agent_sdk import (
     TextBlock,
 )
 
-from .config import CLAUDE_ROOT, USER_CREDENTIALS
-from .database import init_db
+from .config import CLAUDE_ROOT, ENABLE_VERBOSE_LOGS, USER_CREDENTIALS_BYTES
+from .database import close_db_connections, init_db
+from .json_codec import dumps_bytes
 from .models import (
     ChatRequest,
     LoadSessionsRequest,
+    LoadSessionsResponse,
     Session,
     SessionSummary,
     UserSettings,
@@ -33,19 +39,63 @@ from .session_store import (
     fetch_session,
     list_session_summaries,
     persist_session_metadata,
+    stream_session_messages,
+)
+from .streaming import (
+    _dump_sdk_message,
+    _log_sdk_message,
+    encode_sdk_payload,
+    format_sse,
+    format_sse_message,
+    with_keepalive,
 )
-from .streaming import _dump_sdk_message, _log_sdk_message, format_sse
 from .user_settings_store import fetch_user_settings, upsert_user_settings
 
 
 _http_basic = HTTPBasic()
-
-
-def _require_user(credentials: HTTPBasicCredentials = Depends(_http_basic)) -> str:
+_UNKNOWN_USER_PASSWORD = b"\x00" * 32
+_SESSION_SUMMARY_LIST = TypeAdapter(List[SessionSummary])
+_SESSION_JSON_CHUNK_SIZE = 64 * 1024
+_SESSION_TITLE_MAX = 30
+_BOOTSTRAP_SHUTDOWN_TIMEOUT = 5.0
+
+
+def _new_session_title(message: str) -> str:
+    title = message.strip()
+    if not title:
+        return "新会话"
+    if len(title) <= _SESSION_TITLE_MAX:
+        return title
+    return f"{title[:_SESSION_TITLE_MAX]}..."
+
+
+def _iter_session_json(session: Session) -> Iterator[bytes]:
+    """把会话详情按块写成 JSON，消息逐条编码，不再先拼出完整的响应体。"""
+    header = session.model_dump_json(exclude={"messages"}).encode("utf-8")
+    buffer = bytearray(header[:-1])
+    buffer += b',"messages":['
+    first = True
+    for record in stream_session_messages(session.cwd, session.session_id):
+        if not first:
+            buffer += b","
+        first = False
+        buffer += dumps_bytes(record)
+        if len(buffer) >= _SESSION_JSON_CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]}"
+    yield bytes(buffer)
+
+
+async def _require_user(
+    credentials: HTTPBasicCredentials = Depends(_http_basic),
+) -> str:
     username = credentials.username or ""
-    password = credentials.password or ""
-    stored_password = USER_CREDENTIALS.get(username)
-    if not stored_password or not secrets.compare_digest(password, stored_password):
+    password = (credentials.password or "").encode("utf-8")
+    stored_password = USER_CREDENTIALS_BYTES.get(username)
+    # 未知用户也做一次比较，避免通过响应时间探测用户名是否存在
+    matched = hmac.compare_digest(password, stored_password or _UNKNOWN_USER_PASSWORD)
+    if not stored_password or not matched:
         raise HTTPException(
             status_code=401,
             detail="Unauthorized",
@@ -59,15 +109,9 @@ def _extract_session_id_from_payload(payload: Any) -> Optional[str]:
         return None
 
     stack: List[Dict[str, Any]] = [payload]
-    seen: set[int] = set()
 
     while stack:
         current = stack.pop()
-        current_id = id(current)
-        if current_id in seen:
-            continue
-        seen.add(current_id)
-
         value = current.get("session_id") or current.get("sessionId")
         if isinstance(value, str) and value:
             return value
@@ -83,39 +127,96 @@ def _extract_session_id_from_payload(payload: Any) -> Optional[str]:
     return None
 
 
-def create_app() -> FastAPI:
-    init_db()
-    bootstrap_sessions_from_files()
+def _resolve_session_cwd(cwd: str) -> Optional[str]:
+    path = Path(cwd)
+    if not path.is_dir():
+        return None
+    return str(path.resolve())
+
+
+def _resolve_path(value: str) -> str:
+    return str(Path(value).resolve())
 
-    app = FastAPI(title="Claude Agent SDK Chat Backend (Streaming + Sessions + CWD)")
+
+async def _bootstrap_sessions_in_background() -> None:
+    try:
+        stats = await asyncio.to_thread(bootstrap_sessions_from_files)
+    except Exception as exc:
+        print(f"[bootstrap] failed to load sessions from files: {exc}", flush=True)
+    else:
+        print(
+            f"[bootstrap] sessions={stats['sessions']} agent_runs={stats['agent_runs']}",
+            flush=True,
+        )
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    启动时只同步建表；扫描 ~/.claude 的会话文件放到后台任务里，不阻塞服务就绪
+    """
+    await asyncio.to_thread(init_db)
+    app.state.bootstrap_task = asyncio.create_task(_bootstrap_sessions_in_background())
+    try:
+        yield
+    finally:
+        task: asyncio.Task = app.state.bootstrap_task
+        if not task.done():
+            # cancel 只会取消等待的协程，to_thread 里的扫描线程仍会跑完并把连接还回连接池；
+            # 先限时等它结束，再关闭连接池，避免关闭后又有连接被放回去
+            await asyncio.wait({task}, timeout=_BOOTSTRAP_SHUTDOWN_TIMEOUT)
+            task.cancel()
+        close_db_connections()
+
+
+async def _wait_for_bootstrap(app: FastAPI) -> None:
+    task: Optional[asyncio.Task] = getattr(app.state, "bootstrap_task", None)
+    if task is not None and not task.done():
+        await asyncio.shield(task)
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(
+        title="Claude Agent SDK Chat Backend (Streaming + Sessions + CWD)",
+        lifespan=_lifespan,
+    )
 
     @app.get("/sessions", response_model=List[SessionSummary])
     async def list_sessions_route(
         _current_user: str = Depends(_require_user),
-    ) -> List[SessionSummary]:
+    ) -> Response:
         """
         列出当前进程里所有已知会话（包含 cwd）
         """
-        return list_session_summaries()
+        await _wait_for_bootstrap(app)
+        summaries = await asyncio.to_thread(list_session_summaries)
+        # 数据来自本地数据库，直接序列化，跳过 response_model 的二次校验
+        return Response(
+            content=_SESSION_SUMMARY_LIST.dump_json(summaries),
+            media_type="application/json",
+        )
 
     @app.get("/sessions/{session_id}", response_model=Session)
     async def get_session_route(
         session_id: str, _current_user: str = Depends(_require_user)
-    ) -> Session:
+    ) -> Response:
         """
         返回某个会话的详细信息（包含 cwd 和历史消息）
         """
-        sess = fetch_session(session_id)
+        await _wait_for_bootstrap(app)
+        sess = await asyncio.to_thread(fetch_session, session_id)
         if not sess:
             raise HTTPException(status_code=404, detail="Session not found")
-        return sess
+        # 同步生成器由 Starlette 放到线程池里迭代，读取 jsonl 不会阻塞事件循环
+        return StreamingResponse(_iter_session_json(sess), media_type="application/json")
 
-    @app.post("/sessions/load")
+    @app.post("/sessions/load", response_model=LoadSessionsResponse)
     async def load_sessions_route(
         body: LoadSessionsRequest, _current_user: str = Depends(_require_user)
-    ):
+    ) -> LoadSessionsResponse:
         try:
-            stats = bootstrap_sessions_from_files(body.claude_dir)
+            # 扫描全部 jsonl 并批量写库，放到线程里执行，避免阻塞其它连接
+            stats = await asyncio.to_thread(bootstrap_sessions_from_files, body.claude_dir)
         except FileNotFoundError as exc:
             raise HTTPException(status_code=400, detail=str(exc)) from exc
 
@@ -123,11 +224,11 @@ def create_app() -> FastAPI:
             Path(body.claude_dir).expanduser() if body.claude_dir else CLAUDE_ROOT
         )
 
-        return {
-            "claude_dir": str(resolved_root),
-            "sessions_loaded": stats["sessions"],
-            "agent_runs_loaded": stats["agent_runs"],
-        }
+        return LoadSessionsResponse(
+            claude_dir=str(resolved_root),
+            sessions_loaded=stats["sessions"],
+            agent_runs_loaded=stats["agent_runs"],
+        )
 
     @app.get("/users/{user_id}/settings", response_model=UserSettings)
     async def get_user_settings_route(
@@ -135,7 +236,7 @@ def create_app() -> FastAPI:
     ) -> UserSettings:
         if current_user != user_id:
             raise HTTPException(status_code=403, detail="Forbidden")
-        settings = fetch_user_settings(user_id)
+        settings = await asyncio.to_thread(fetch_user_settings, user_id)
         if settings is None:
             return UserSettings(user_id=user_id)
         return settings
@@ -148,7 +249,8 @@ def create_app() -> FastAPI:
     ) -> UserSettings:
         if current_user != user_id:
             raise HTTPException(status_code=403, detail="Forbidden")
-        return upsert_user_settings(
+        return await asyncio.to_thread(
+            upsert_user_settings,
             user_id=user_id,
             permission_mode=body.permission_mode,
             system_prompt=body.system_prompt,
@@ -175,52 +277,68 @@ def create_app() -> FastAPI:
                     status_code=400,
                     detail="cwd is required when starting a new session",
                 )
-            if not Path(body.cwd).is_dir():
+            resolved_cwd = await asyncio.to_thread(_resolve_session_cwd, body.cwd)
+            if resolved_cwd is None:
                 raise HTTPException(
                     status_code=400,
                     detail=f"cwd does not exist or is not a directory: {body.cwd}",
                 )
-            final_cwd = str(Path(body.cwd).resolve())
+            final_cwd = resolved_cwd
         else:
             assert body.session_id is not None
-            existing_session = fetch_session(body.session_id, include_messages=False)
+            await _wait_for_bootstrap(app)
+            session_lookup = asyncio.to_thread(fetch_session, body.session_id)
+            requested_cwd: Optional[str] = None
+            if body.cwd:
+                existing_session, requested_cwd = await asyncio.gather(
+                    session_lookup, asyncio.to_thread(_resolve_path, body.cwd)
+                )
+            else:
+                existing_session = await session_lookup
             if not existing_session:
                 raise HTTPException(status_code=404, detail="Session not found")
 
-            if body.cwd and Path(body.cwd).resolve() != Path(
-                existing_session.cwd
-            ).resolve():
+            if (
+                requested_cwd is not None
+                and requested_cwd != existing_session.cwd
+                and requested_cwd
+                != await asyncio.to_thread(_resolve_path, existing_session.cwd)
+            ):
                 raise HTTPException(
                     status_code=400,
                     detail="cwd mismatch for existing session",
                 )
             final_cwd = existing_session.cwd
 
-        async def event_stream():
+        if existing_session is None:
+            session_title = _new_session_title(body.message)
+        else:
+            session_title = existing_session.title
+
+        async def event_stream() -> AsyncIterator[bytes]:
             session_id: Optional[str] = body.session_id
-            assistant_chunks: List[str] = []
+            assistant_length = 0
             user_message_text = body.message
-            new_session_title = user_message_text.strip() or "新会话"
-            if len(new_session_title) > 30:
-                new_session_title = new_session_title[:30] + "..."
 
             try:
                 options = ClaudeAgentOptions(
                     resume=body.session_id,
                     cwd=final_cwd,
-                    include_partial_messages=True,
+                    include_partial_messages=body.include_partial_messages,
                     setting_sources=["user"],
                     permission_mode=body.permission_mode,
                     system_prompt=body.system_prompt,
                 )
 
                 async for message in query(prompt=user_message_text, options=options):
+                    message_type_name = type(message).__name__
                     raw_payload = _dump_sdk_message(message)
                     if raw_payload is not None:
-                        _log_sdk_message(type(message).__name__, raw_payload)
-                    else:
+                        payload_json = encode_sdk_payload(raw_payload)
+                        _log_sdk_message(message_type_name, raw_payload, payload_json)
+                    elif ENABLE_VERBOSE_LOGS:
                         _log_sdk_message(
-                            type(message).__name__,
+                            message_type_name,
                             {"__repr__": repr(message)},
                         )
 
@@ -229,9 +347,10 @@ def create_app() -> FastAPI:
                             if session_id is None:
                                 session_id = message.data.get("session_id")
                                 if session_id is not None and is_new_session:
-                                    persist_session_metadata(
+                                    await asyncio.to_thread(
+                                        persist_session_metadata,
                                         session_id=session_id,
-                                        title=new_session_title,
+                                        title=session_title,
                                         cwd=final_cwd,
                                         created_at=now,
                                         updated_at=now,
@@ -254,22 +373,27 @@ def create_app() -> FastAPI:
                                     },
                                 )
 
-                    if isinstance(message, AssistantMessage):
-                        for block in message.content:
-                            if isinstance(block, TextBlock):
-                                chunk = block.text
-                                if not chunk:
-                                    continue
-                                assistant_chunks.append(chunk)
-                                yield format_sse(
-                                    "token",
-                                    {
-                                        "session_id": session_id,
-                                        "text": chunk,
-                                    },
-                                )
+                    elif isinstance(message, AssistantMessage):
+                        # 同一条消息里连续的文本块合并成一帧 token，减少 SSE 帧数；
+                        # 工具调用等非文本块会断开合并，文本与工具调用的先后关系不变
+                        for is_text, blocks in groupby(
+                            message.content, key=lambda block: isinstance(block, TextBlock)
+                        ):
+                            if not is_text:
+                                continue
+                            chunk = "".join(block.text for block in blocks if block.text)
+                            if not chunk:
+                                continue
+                            assistant_length += len(chunk)
+                            yield format_sse(
+                                "token",
+                                {
+                                    "session_id": session_id,
+                                    "text": chunk,
+                                },
+                            )
 
-                    if isinstance(message, ResultMessage):
+                    elif isinstance(message, ResultMessage):
                         if session_id is None:
                             session_id = message.session_id
                             yield format_sse(
@@ -281,39 +405,34 @@ def create_app() -> FastAPI:
                                 },
                             )
 
-                        if message.result is not None and not assistant_chunks:
-                            assistant_chunks.append(message.result)
+                        if message.result is not None and not assistant_length:
+                            assistant_length = len(message.result)
 
                     if raw_payload is not None:
+                        # 优先取消息自身顶层的 session_id（恢复会话时 SDK 可能返回新的 id），
+                        # 其次沿用本轮已知的 id；两者都没有时才深度遍历整个 payload
                         payload_session_id = (
-                            _extract_session_id_from_payload(raw_payload) or session_id
+                            raw_payload.get("session_id")
+                            or raw_payload.get("sessionId")
+                            or session_id
+                            or _extract_session_id_from_payload(raw_payload)
                         )
-                        if session_id is None and payload_session_id is not None:
+                        if session_id is None:
                             session_id = payload_session_id
-                        yield format_sse(
-                            "message",
-                            {
-                                "session_id": payload_session_id,
-                                "payload": raw_payload,
-                            },
-                        )
+                        yield format_sse_message(payload_session_id, payload_json)
 
                 if session_id is None:
                     raise RuntimeError("Claude did not return session_id")
 
-                full_assistant_text = "".join(assistant_chunks)
-
-                if existing_session is None:
-                    title = new_session_title
-                else:
-                    title = existing_session.title
-
-                persist_session_metadata(
+                # 本轮对话已写入 jsonl，顺带刷新缓存在数据库里的消息条数
+                await asyncio.to_thread(
+                    persist_session_metadata,
                     session_id=session_id,
-                    title=title,
+                    title=session_title,
                     cwd=final_cwd,
                     created_at=now,
                     updated_at=now,
+                    refresh_message_count=True,
                 )
 
                 yield format_sse(
@@ -321,7 +440,7 @@ def create_app() -> FastAPI:
                     {
                         "session_id": session_id,
                         "cwd": final_cwd,
-                        "length": len(full_assistant_text),
+                        "length": assistant_length,
                     },
                 )
 
@@ -334,7 +453,7 @@ def create_app() -> FastAPI:
                 )
 
         return StreamingResponse(
-            event_stream(),
+            with_keepalive(event_stream()),
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
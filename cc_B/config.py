@@ -2,11 +2,10 @@ from __future__ import annotations
 
 import os
 import platform
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict
 
-import yaml
-
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 CONFIG_PATH = PROJECT_ROOT / "config.yaml"
 DEFAULT_USER_CREDENTIALS = {"admin": "642531"}
@@ -59,20 +58,32 @@ def _detect_claude_dir() -> Path:
     return fallback
 
 
+def _read_config_file() -> Any:
+    try:
+        handler = CONFIG_PATH.open("r", encoding="utf-8")
+    except FileNotFoundError:
+        return {}
+
+    import yaml  # 仅在配置文件存在时才加载 YAML 解析器
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with handler:
+        try:
+            return yaml.load(handler, Loader=loader) or {}
+        except yaml.YAMLError:
+            return {}
+
+
+@lru_cache(maxsize=1)
 def load_app_config() -> Dict[str, Any]:
     defaults = {
         "claude_dir": "",
         "sessions_db": str(PROJECT_ROOT / "sessions.db"),
         "users": DEFAULT_USER_CREDENTIALS.copy(),
+        "verbose_logs": True,
     }
 
-    try:
-        with CONFIG_PATH.open("r", encoding="utf-8") as handler:
-            data = yaml.safe_load(handler) or {}
-    except FileNotFoundError:
-        data = {}
-    except yaml.YAMLError:
-        data = {}
+    data = _read_config_file()
 
     if not isinstance(data, dict):
         data = {}
@@ -101,6 +112,18 @@ def load_app_config() -> Dict[str, Any]:
             if sanitized:
                 config["users"] = sanitized
             continue
+        if key == "verbose_logs":
+            if isinstance(value, bool):
+                config["verbose_logs"] = value
+            elif isinstance(value, str):
+                normalized_flag = value.strip().lower()
+                if normalized_flag in ("true", "1", "yes", "on"):
+                    config["verbose_logs"] = True
+                elif normalized_flag in ("false", "0", "no", "off"):
+                    config["verbose_logs"] = False
+            elif isinstance(value, (int, float)):
+                config["verbose_logs"] = value != 0
+            continue
         if isinstance(value, str) and value.strip():
             config[key] = value.strip()
 
@@ -117,4 +140,8 @@ _db_path = Path(CONFIG["sessions_db"])
 if not _db_path.is_absolute():
     _db_path = (CONFIG_PATH.parent / _db_path).resolve()
 DB_PATH = _db_path
+ENABLE_VERBOSE_LOGS = CONFIG["verbose_logs"] is not False
 USER_CREDENTIALS = CONFIG["users"]
+USER_CREDENTIALS_BYTES: Dict[str, bytes] = {
+    username: password.encode("utf-8") for username, password in USER_CREDENTIALS.items()
+}
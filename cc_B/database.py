@@ -1,22 +1,63 @@
 from __future__ import annotations
 
+import queue
 import sqlite3
 from contextlib import contextmanager
 from typing import Iterator
 
 from .config import DB_PATH
 
+_POOL_SIZE = 8
+_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=_POOL_SIZE)
 
-@contextmanager
-def db_connection() -> Iterator[sqlite3.Connection]:
+
+def _open_connection() -> sqlite3.Connection:
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
     conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -64000")
+    # 读操作直接走内存映射，省去 read() 拷贝到页缓存的开销
+    conn.execute("PRAGMA mmap_size = 268435456")
+    return conn
+
+
+@contextmanager
+def db_connection() -> Iterator[sqlite3.Connection]:
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection()
+
+    reusable = True
     try:
         yield conn
         conn.commit()
+    except BaseException:
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            reusable = False
+        raise
     finally:
+        if reusable:
+            try:
+                _pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+        else:
+            conn.close()
+
+
+def close_db_connections() -> None:
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            return
         conn.close()
 
 
@@ -29,10 +70,23 @@ def init_db() -> None:
                 title TEXT NOT NULL,
                 cwd TEXT NOT NULL,
                 created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL
+                updated_at TEXT NOT NULL,
+                message_count INTEGER,
+                jsonl_size INTEGER,
+                jsonl_mtime_ns INTEGER
             )
             """
         )
+        session_columns = {
+            row["name"] for row in conn.execute("PRAGMA table_info(sessions)")
+        }
+        for column in ("message_count", "jsonl_size", "jsonl_mtime_ns"):
+            if column not in session_columns:
+                conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} INTEGER")
+        # updated_at 统一存为 UTC ISO-8601 字符串，字典序即时间序，列表排序可直接走索引
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at DESC)"
+        )
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS agent_sessions (
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    orjson = None
+
+# orjson.JSONDecodeError 继承自 json.JSONDecodeError，调用方只需捕获这一个类型
+JSONDecodeError = json.JSONDecodeError
+
+
+def dumps_bytes(value: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """序列化为紧凑的 UTF-8 JSON bytes；优先使用 orjson，超出其支持范围时回退标准库。
+
+    default 与 json.dumps 的同名参数含义相同：遇到编码器不认识的对象时调用。
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(
+        value, default=default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def dumps(value: Any) -> str:
+    return dumps_bytes(value).decode("utf-8")
+
+
+def dumps_pretty(value: Any) -> str:
+    """缩进两格的 JSON 文本，用于日志输出。"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                value, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+            ).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(value, ensure_ascii=False, indent=2)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """解析 JSON 文本或 UTF-8 bytes。
+
+    orjson 不接受 NaN/Infinity 等标准库允许的扩展写法，解析失败时交给标准库再试一次；
+    非法 UTF-8 的 bytes 会抛出 UnicodeDecodeError，两者都是 ValueError 的子类。
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import socket
+from functools import lru_cache
 
 from cc_B.app_factory import create_app
 from cc_B.config import CONFIG
@@ -8,9 +9,12 @@ from cc_B.config import CONFIG
 app = create_app()
 
 
+@lru_cache(maxsize=1)
 def _detect_local_ip() -> str:
+    # UDP connect 不会真正发包，只用来让内核选出出口网卡地址；加超时防止异常环境下卡住启动
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(0.2)
             sock.connect(("8.8.8.8", 80))
             return sock.getsockname()[0]
     except OSError:
@@ -36,4 +40,6 @@ if __name__ == "__main__":
     print(f"local_url: {url}")
     print("====================================================")
 
-    uvicorn.run("cc_B.main:app", host="0.0.0.0", port=port, reload=False)
+    # 直接传入已创建的 app，避免 uvicorn 按字符串重新导入本模块而再次初始化
+    # loop/http 保持 uvicorn 的默认 "auto"：已安装 uvloop/httptools 时自动选用
+    uvicorn.run(app, host="0.0.0.0", port=port, reload=False)
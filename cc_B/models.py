@@ -25,6 +25,9 @@ class SessionFileMetadata:
     updated_at: datetime
     parent_session_id: Optional[str] = None
     is_agent_run: bool = False
+    message_count: Optional[int] = None
+    jsonl_size: Optional[int] = None
+    jsonl_mtime_ns: Optional[int] = None
 
 
 def _default_system_prompt() -> Dict[str, str]:
@@ -37,6 +40,7 @@ class ChatRequest(BaseModel):
     message: str
     permission_mode: Literal["default", "plan", "acceptEdits", "bypassPermissions"] = "default"
     system_prompt: str | Dict[str, Any] | None = Field(default_factory=_default_system_prompt)
+    include_partial_messages: bool = True
 
 
 class SessionSummary(BaseModel):
@@ -52,6 +56,12 @@ class LoadSessionsRequest(BaseModel):
     claude_dir: Optional[str] = None
 
 
+class LoadSessionsResponse(BaseModel):
+    claude_dir: str
+    sessions_loaded: int
+    agent_runs_loaded: int
+
+
 class UserSettingsRequest(BaseModel):
     permission_mode: Literal["default", "plan", "acceptEdits", "bypassPermissions"] = "default"
     system_prompt: str | Dict[str, Any] | None = Field(default_factory=_default_system_prompt)
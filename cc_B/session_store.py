@@ -1,15 +1,25 @@
 from __future__ import annotations
 
-import json
+import os
 import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Iterator, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+from .cache import TTLCache
 from .config import CLAUDE_PROJECTS_DIR, CLAUDE_ROOT
 from .database import db_connection
+from .json_codec import loads as json_loads
 from .models import Session, SessionFileMetadata, SessionSummary
 
+_session_cache: TTLCache[str, Session] = TTLCache(maxsize=1024, ttl=5.0)
+
+# 会话文件路径 -> (st_mtime_ns, st_size, 解析结果)，文件未变化时跳过重新解析
+_file_metadata_cache: Dict[str, Tuple[int, int, Optional[SessionFileMetadata]]] = {}
+
 
 def _dt_to_str(dt: datetime) -> str:
     if dt.tzinfo is None:
@@ -32,8 +42,21 @@ def _parse_iso_timestamp(value: Optional[str]) -> datetime:
         return datetime.now(timezone.utc)
 
 
+_SLUG_RE = re.compile(r"[^0-9A-Za-z]")
+_JSONL_READ_BUFFER = 1 << 20
+_METADATA_SCAN_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+
+# cwd 的取值集合很小，按原始字符串缓存
+@lru_cache(maxsize=1024)
 def _cwd_to_project_slug(cwd: str) -> str:
-    normalized_path = Path(cwd).resolve()
+    # 数据库中的 cwd 总是绝对路径：新会话在创建时已 resolve()，导入的会话来自
+    # CLI 记录的工作目录（CLI 也按该字符串生成项目目录名）。绝对路径只做纯字符串
+    # 规范化，不再访问文件系统；只有相对路径才需要 resolve()。
+    if os.path.isabs(cwd):
+        normalized_path = Path(os.path.normpath(cwd))
+    else:
+        normalized_path = Path(cwd).resolve()
     try:
         relative = normalized_path.relative_to(CLAUDE_PROJECTS_DIR)
     except ValueError:
@@ -43,46 +66,28 @@ def _cwd_to_project_slug(cwd: str) -> str:
         if parts:
             return parts[0]
     normalized = str(normalized_path)
-    return re.sub(r"[^0-9A-Za-z]", "-", normalized)
+    return _SLUG_RE.sub("-", normalized)
 
 
+@lru_cache(maxsize=1024)
 def _session_file_path(cwd: str, session_id: str) -> Path:
     slug = _cwd_to_project_slug(cwd)
     return CLAUDE_PROJECTS_DIR / slug / f"{session_id}.jsonl"
 
 
-def load_session_messages_from_jsonl(cwd: str, session_id: str) -> List[Dict[str, Any]]:
-    path = _session_file_path(cwd, session_id)
-    if not path.exists():
-        return []
+def _count_session_file(path: Path) -> Tuple[int, Optional[int], Optional[int]]:
+    """返回 (非空行数, st_size, st_mtime_ns)；文件不存在时为 (0, None, None)。
 
-    messages: List[Dict[str, Any]] = []
-    with path.open("r", encoding="utf-8") as handler:
-        for line in handler:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                record = json.loads(line)
-            except json.JSONDecodeError:
-                continue
-
-            messages.append(record)
-
-    return messages
-
-
-def count_session_messages(cwd: str, session_id: str) -> int:
-    path = _session_file_path(cwd, session_id)
-    if not path.exists():
-        return 0
-
-    count = 0
-    with path.open("r", encoding="utf-8") as handler:
-        for line in handler:
-            if line.strip():
-                count += 1
-    return count
+    只计数不做 JSON 解析。stat 取自同一个文件句柄，
+    计数期间文件若被追加，下次列表时 stat 不匹配会再重新统计。
+    """
+    try:
+        with path.open("rb", buffering=_JSONL_READ_BUFFER) as handler:
+            stat = os.fstat(handler.fileno())
+            count = sum(1 for line in handler if line.strip())
+    except OSError:
+        return 0, None, None
+    return count, stat.st_size, stat.st_mtime_ns
 
 
 def _is_agent_session_file(path: Path) -> bool:
@@ -90,51 +95,50 @@ def _is_agent_session_file(path: Path) -> bool:
     return filename.startswith("agent-") and filename.endswith(".jsonl")
 
 
-def _iter_session_records(cwd: str, session_id: str) -> Iterator[Dict[str, Any]]:
-    path = _session_file_path(cwd, session_id)
-    if not path.exists():
-        return iter(())
-
-    def generator() -> Iterator[Dict[str, Any]]:
-        with path.open("r", encoding="utf-8") as handler:
-            for line in handler:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    yield json.loads(line)
-                except json.JSONDecodeError:
-                    continue
+def stream_session_messages(cwd: str, session_id: str) -> Iterator[Dict[str, Any]]:
+    """逐行读取 jsonl 并逐条产出消息，供 HTTP 层边序列化边发送。
 
-    return generator()
+    整份会话不会先解析成列表；跳过空行和无法解析的行，文件不存在时不产出任何消息。
+    """
+    try:
+        handler = _session_file_path(cwd, session_id).open(
+            "rb", buffering=_JSONL_READ_BUFFER
+        )
+    except OSError:
+        return
+    with handler:
+        for line in handler:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json_loads(line)
+            except ValueError:
+                continue
+            yield record
 
 
-def _iter_session_files_from_claude(root: Path) -> Iterator[Path]:
+def _iter_session_files_from_claude(root: Path) -> Iterator[os.DirEntry]:
     project_dir = root / "projects"
-    if not project_dir.exists():
+    if not project_dir.is_dir():
         return iter(())
 
-    def generator() -> Iterator[Path]:
-        for project in project_dir.iterdir():
-            if not project.is_dir():
-                continue
-            for file in project.glob("*.jsonl"):
-                if file.is_file():
-                    yield file
+    def generator() -> Iterator[os.DirEntry]:
+        with os.scandir(project_dir) as projects:
+            for project in projects:
+                if not project.is_dir():
+                    continue
+                with os.scandir(project.path) as files:
+                    for entry in files:
+                        if entry.name.endswith(".jsonl") and entry.is_file():
+                            yield entry
 
     return generator()
 
 
-def _extract_session_metadata_from_file(path: Path) -> Optional[SessionFileMetadata]:
-    try:
-        with path.open("r", encoding="utf-8") as handler:
-            first_line = handler.readline()
-            if not first_line:
-                return None
-            data = json.loads(first_line)
-    except (OSError, json.JSONDecodeError, UnicodeDecodeError):
-        return None
-
+def _build_session_metadata(
+    path: Path, data: Dict[str, Any], message_count: int
+) -> Optional[SessionFileMetadata]:
     session_id = data.get("session_id")
     if not session_id:
         session_id = path.stem
@@ -157,91 +161,236 @@ def _extract_session_metadata_from_file(path: Path) -> Optional[SessionFileMetad
         updated_at=updated_at,
         parent_session_id=parent_session_id,
         is_agent_run=is_agent_run,
+        message_count=message_count,
     )
 
 
-def _discover_session_metadata_from_files(root: Path) -> Iterator[SessionFileMetadata]:
-    for path in _iter_session_files_from_claude(root):
-        metadata = _extract_session_metadata_from_file(path)
-        if metadata:
-            yield metadata
+def _extract_session_metadata_from_file(path: Path) -> Optional[SessionFileMetadata]:
+    """元数据只来自首行：首行解析完即可判定，其余行只计数、不做 JSON 解码。
 
+    启动扫描会遍历全部历史文件，走这条轻量路径可以省去逐行解析。
+    """
+    try:
+        with path.open("rb", buffering=_JSONL_READ_BUFFER) as handler:
+            first_line = handler.readline()
+            try:
+                data = json_loads(first_line)
+            except ValueError:
+                return None
+            if not isinstance(data, dict):
+                return None
+
+            metadata = _build_session_metadata(path, data, 1)
+            if metadata is None:
+                return None
+            stat = os.fstat(handler.fileno())
+            metadata.message_count = 1 + sum(1 for line in handler if line.strip())
+            metadata.jsonl_size = stat.st_size
+            metadata.jsonl_mtime_ns = stat.st_mtime_ns
+    except OSError:
+        return None
+    return metadata
 
-def fetch_session(session_id: str, include_messages: bool = True) -> Optional[Session]:
-    with db_connection() as conn:
-        row = conn.execute(
-            "SELECT session_id, title, cwd, created_at, updated_at FROM sessions WHERE session_id = ?",
-            (session_id,),
-        ).fetchone()
 
-    if not row:
+def _extract_session_metadata_cached(entry: os.DirEntry) -> Optional[SessionFileMetadata]:
+    try:
+        stat = entry.stat()
+    except OSError:
         return None
 
-    messages: List[Dict[str, Any]] = []
-    if include_messages:
-        messages = load_session_messages_from_jsonl(row["cwd"], row["session_id"])
-
-    return Session(
-        session_id=row["session_id"],
-        title=row["title"],
-        cwd=row["cwd"],
-        created_at=_str_to_dt(row["created_at"]),
-        updated_at=_str_to_dt(row["updated_at"]),
-        messages=messages,
-    )
+    cached = _file_metadata_cache.get(entry.path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    metadata = _extract_session_metadata_from_file(Path(entry.path))
+    _file_metadata_cache[entry.path] = (stat.st_mtime_ns, stat.st_size, metadata)
+    return metadata
+
+
+def _discover_session_metadata_from_files(root: Path) -> Iterator[SessionFileMetadata]:
+    entries = list(_iter_session_files_from_claude(root))
+    seen_paths = {entry.path for entry in entries}
+    # 每个文件的 stat/读取彼此独立，读文件时会释放 GIL，用线程池并行处理
+    with ThreadPoolExecutor(max_workers=_METADATA_SCAN_WORKERS) as executor:
+        for metadata in executor.map(_extract_session_metadata_cached, entries):
+            if metadata:
+                yield metadata
+
+    # 完整遍历后清掉该目录下已被删除文件的缓存条目，避免缓存无限增长
+    prefix = os.path.join(str(root / "projects"), "")
+    for path in list(_file_metadata_cache):
+        if path.startswith(prefix) and path not in seen_paths:
+            _file_metadata_cache.pop(path, None)
+
+
+def _tuple_cursor(conn: sqlite3.Connection) -> sqlite3.Cursor:
+    """返回按位置取值的游标：热点查询按列顺序解包，省去 sqlite3.Row 的按名查找。"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor
+
+
+def fetch_session(session_id: str) -> Optional[Session]:
+    """只返回会话元数据；消息由调用方按需通过 stream_session_messages 逐条读取。"""
+    session = _session_cache.get(session_id)
+    if session is None:
+        with db_connection() as conn:
+            row = _tuple_cursor(conn).execute(
+                "SELECT title, cwd, created_at, updated_at FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+
+        if not row:
+            return None
+
+        title, cwd, created_at, updated_at = row
+        session = Session.model_construct(
+            session_id=session_id,
+            title=title,
+            cwd=cwd,
+            created_at=_str_to_dt(created_at),
+            updated_at=_str_to_dt(updated_at),
+        )
+        _session_cache.set(session_id, session)
+
+    return session
 
 
 def list_session_summaries() -> List[SessionSummary]:
     results: List[SessionSummary] = []
     with db_connection() as conn:
-        rows = conn.execute(
-            "SELECT session_id, title, cwd, created_at, updated_at FROM sessions ORDER BY updated_at DESC"
+        rows = _tuple_cursor(conn).execute(
+            "SELECT session_id, title, cwd, created_at, updated_at, message_count, jsonl_size, jsonl_mtime_ns "
+            "FROM sessions ORDER BY updated_at DESC"
         ).fetchall()
 
-    for row in rows:
-        message_count = count_session_messages(row["cwd"], row["session_id"])
+    # message_count 与统计时 jsonl 的 (size, mtime_ns) 一起保存：尚未统计，或文件在别处
+    # （例如直接用 CLI 继续了会话）被改动过时，才重新读取 jsonl 并回填
+    backfill: List[Tuple[int, Optional[int], Optional[int], str]] = []
+    for (
+        session_id,
+        title,
+        cwd,
+        created_at,
+        updated_at,
+        message_count,
+        jsonl_size,
+        jsonl_mtime_ns,
+    ) in rows:
+        path = _session_file_path(cwd, session_id)
+        stale = message_count is None
+        if not stale:
+            try:
+                stat = path.stat()
+            except OSError:
+                pass
+            else:
+                stale = stat.st_size != jsonl_size or stat.st_mtime_ns != jsonl_mtime_ns
+        if stale:
+            message_count, jsonl_size, jsonl_mtime_ns = _count_session_file(path)
+            backfill.append((message_count, jsonl_size, jsonl_mtime_ns, session_id))
         results.append(
-            SessionSummary(
-                session_id=row["session_id"],
-                title=row["title"],
-                cwd=row["cwd"],
-                created_at=_str_to_dt(row["created_at"]),
-                updated_at=_str_to_dt(row["updated_at"]),
+            SessionSummary.model_construct(
+                session_id=session_id,
+                title=title,
+                cwd=cwd,
+                created_at=_str_to_dt(created_at),
+                updated_at=_str_to_dt(updated_at),
                 message_count=message_count,
             )
         )
 
+    if backfill:
+        with db_connection() as conn:
+            conn.executemany(
+                "UPDATE sessions SET message_count = ?, jsonl_size = ?, jsonl_mtime_ns = ? "
+                "WHERE session_id = ?",
+                backfill,
+            )
+
     return results
 
 
+_UPSERT_SESSION_SQL = """
+    INSERT INTO sessions (
+        session_id, title, cwd, created_at, updated_at, message_count, jsonl_size, jsonl_mtime_ns
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(session_id) DO UPDATE SET
+        title = excluded.title,
+        cwd = excluded.cwd,
+        message_count = COALESCE(excluded.message_count, sessions.message_count),
+        jsonl_size = CASE
+            WHEN excluded.message_count IS NULL THEN sessions.jsonl_size
+            ELSE excluded.jsonl_size
+        END,
+        jsonl_mtime_ns = CASE
+            WHEN excluded.message_count IS NULL THEN sessions.jsonl_mtime_ns
+            ELSE excluded.jsonl_mtime_ns
+        END,
+        created_at = CASE
+            WHEN excluded.created_at < sessions.created_at THEN excluded.created_at
+            ELSE sessions.created_at
+        END,
+        updated_at = CASE
+            WHEN excluded.updated_at > sessions.updated_at THEN excluded.updated_at
+            ELSE sessions.updated_at
+        END
+"""
+
+# 父会话不存在时由子查询得到 NULL，外键约束下也不会插入失败
+_UPSERT_AGENT_SESSION_SQL = """
+    INSERT INTO agent_sessions (agent_id, parent_session_id, title, cwd, created_at, updated_at)
+    VALUES (?, (SELECT session_id FROM sessions WHERE session_id = ?), ?, ?, ?, ?)
+    ON CONFLICT(agent_id) DO UPDATE SET
+        parent_session_id = COALESCE(excluded.parent_session_id, agent_sessions.parent_session_id),
+        title = excluded.title,
+        cwd = excluded.cwd,
+        created_at = CASE
+            WHEN agent_sessions.created_at IS NULL THEN excluded.created_at
+            WHEN excluded.created_at < agent_sessions.created_at THEN excluded.created_at
+            ELSE agent_sessions.created_at
+        END,
+        updated_at = CASE
+            WHEN agent_sessions.updated_at IS NULL THEN excluded.updated_at
+            WHEN excluded.updated_at > agent_sessions.updated_at THEN excluded.updated_at
+            ELSE agent_sessions.updated_at
+        END
+"""
+
+
 def persist_session_metadata(
-    *, session_id: str, title: str, cwd: str, created_at: datetime, updated_at: datetime
+    *,
+    session_id: str,
+    title: str,
+    cwd: str,
+    created_at: datetime,
+    updated_at: datetime,
+    refresh_message_count: bool = False,
 ) -> None:
+    """写入会话元数据；refresh_message_count=True 时顺带重新统计 jsonl 中的消息条数。"""
+    message_count: Optional[int] = None
+    jsonl_size: Optional[int] = None
+    jsonl_mtime_ns: Optional[int] = None
+    if refresh_message_count:
+        message_count, jsonl_size, jsonl_mtime_ns = _count_session_file(
+            _session_file_path(cwd, session_id)
+        )
     with db_connection() as conn:
         conn.execute(
-            """
-            INSERT INTO sessions (session_id, title, cwd, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(session_id) DO UPDATE SET
-                title = excluded.title,
-                cwd = excluded.cwd,
-                created_at = CASE
-                    WHEN excluded.created_at < sessions.created_at THEN excluded.created_at
-                    ELSE sessions.created_at
-                END,
-                updated_at = CASE
-                    WHEN excluded.updated_at > sessions.updated_at THEN excluded.updated_at
-                    ELSE sessions.updated_at
-                END
-            """,
+            _UPSERT_SESSION_SQL,
             (
                 session_id,
                 title,
                 cwd,
                 _dt_to_str(created_at),
                 _dt_to_str(updated_at),
+                message_count,
+                jsonl_size,
+                jsonl_mtime_ns,
             ),
         )
+    _session_cache.pop(session_id)
 
 
 def persist_agent_session_metadata(
@@ -255,24 +404,7 @@ def persist_agent_session_metadata(
 ) -> None:
     with db_connection() as conn:
         conn.execute(
-            """
-            INSERT INTO agent_sessions (agent_id, parent_session_id, title, cwd, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ON CONFLICT(agent_id) DO UPDATE SET
-                parent_session_id = COALESCE(excluded.parent_session_id, agent_sessions.parent_session_id),
-                title = excluded.title,
-                cwd = excluded.cwd,
-                created_at = CASE
-                    WHEN agent_sessions.created_at IS NULL THEN excluded.created_at
-                    WHEN excluded.created_at < agent_sessions.created_at THEN excluded.created_at
-                    ELSE agent_sessions.created_at
-                END,
-                updated_at = CASE
-                    WHEN agent_sessions.updated_at IS NULL THEN excluded.updated_at
-                    WHEN excluded.updated_at > agent_sessions.updated_at THEN excluded.updated_at
-                    ELSE agent_sessions.updated_at
-                END
-            """,
+            _UPSERT_AGENT_SESSION_SQL,
             (
                 agent_id,
                 parent_session_id,
@@ -289,8 +421,6 @@ def bootstrap_sessions_from_files(claude_dir: Optional[str] = None) -> Dict[str,
     if not root.exists():
         raise FileNotFoundError(f"Claude directory does not exist: {root}")
 
-    stats = {"sessions": 0, "agent_runs": 0}
-
     primary_sessions: List[SessionFileMetadata] = []
     agent_sessions: List[SessionFileMetadata] = []
 
@@ -300,36 +430,40 @@ def bootstrap_sessions_from_files(claude_dir: Optional[str] = None) -> Dict[str,
         else:
             primary_sessions.append(metadata)
 
-    existing_session_ids: set[str] = set()
+    # 所有 upsert 放在同一个事务里批量执行，只提交一次
     with db_connection() as conn:
-        rows = conn.execute("SELECT session_id FROM sessions").fetchall()
-        existing_session_ids.update(row["session_id"] for row in rows)
-
-    for metadata in primary_sessions:
-        persist_session_metadata(
-            session_id=metadata.session_id,
-            title=metadata.title,
-            cwd=metadata.cwd,
-            created_at=metadata.created_at,
-            updated_at=metadata.updated_at,
-        )
-        stats["sessions"] += 1
-        existing_session_ids.add(metadata.session_id)
-
-    for metadata in agent_sessions:
-        parent_session_id = (
-            metadata.parent_session_id
-            if metadata.parent_session_id in existing_session_ids
-            else None
+        conn.executemany(
+            _UPSERT_SESSION_SQL,
+            [
+                (
+                    metadata.session_id,
+                    metadata.title,
+                    metadata.cwd,
+                    _dt_to_str(metadata.created_at),
+                    _dt_to_str(metadata.updated_at),
+                    metadata.message_count,
+                    metadata.jsonl_size,
+                    metadata.jsonl_mtime_ns,
+                )
+                for metadata in primary_sessions
+            ],
         )
-        persist_agent_session_metadata(
-            agent_id=metadata.session_id,
-            parent_session_id=parent_session_id,
-            title=metadata.title,
-            cwd=metadata.cwd,
-            created_at=metadata.created_at,
-            updated_at=metadata.updated_at,
+        conn.executemany(
+            _UPSERT_AGENT_SESSION_SQL,
+            [
+                (
+                    metadata.session_id,
+                    metadata.parent_session_id,
+                    metadata.title,
+                    metadata.cwd,
+                    _dt_to_str(metadata.created_at),
+                    _dt_to_str(metadata.updated_at),
+                )
+                for metadata in agent_sessions
+            ],
         )
-        stats["agent_runs"] += 1
 
-    return stats
+    for metadata in primary_sessions:
+        _session_cache.pop(metadata.session_id)
+
+    return {"sessions": len(primary_sessions), "agent_runs": len(agent_sessions)}
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-import json
+import asyncio
 from dataclasses import asdict, is_dataclass
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
 from claude_agent_sdk import (
     AssistantMessage,
@@ -15,67 +15,238 @@ from claude_agent_sdk import (
     UserMessage,
 )
 
+from .config import ENABLE_VERBOSE_LOGS
+from .json_codec import dumps_bytes, dumps_pretty
+
 try:
     from claude_agent_sdk.types import StreamEvent as _StreamEventType
 except ImportError:  # pragma: no cover - fallback for older SDKs
     _StreamEventType = None
 
+SSE_KEEPALIVE_INTERVAL = 15.0
+SSE_KEEPALIVE_FRAME = b": ping\n\n"
+# 待发送帧的上限：客户端读得慢时让生产者等待，而不是把帧无限堆在内存里
+SSE_QUEUE_MAXSIZE = 256
+_STREAM_END = object()
+_SSE_EVENT_PREFIXES: Dict[str, bytes] = {
+    name: f"event: {name}\ndata: ".encode("utf-8")
+    for name in ("session", "token", "message", "done", "error")
+}
+
+
+_SSE_MESSAGE_FRAME_HEAD = _SSE_EVENT_PREFIXES["message"] + b'{"session_id":'
 
-def format_sse(event: str, data: dict) -> str:
+
+def format_sse(event: str, data: dict) -> bytes:
     """
-    把事件打成 SSE 格式:
+    把事件打成 SSE 格式（已编码的 bytes）:
       event: <event>
       data: <json>
     （空行分隔事件）
     """
-    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    prefix = _SSE_EVENT_PREFIXES.get(event)
+    if prefix is None:
+        prefix = f"event: {event}\ndata: ".encode("utf-8")
+    return prefix + dumps_bytes(data) + b"\n\n"
+
+
+def format_sse_message(session_id: Optional[str], payload_json: bytes) -> bytes:
+    """
+    message 事件的快速路径：payload 已经序列化好（同一份 bytes 也用于日志），
+    直接拼进 {"session_id": ..., "payload": ...}，不再对整个 payload 重新编码。
+    """
+    return (
+        _SSE_MESSAGE_FRAME_HEAD
+        + dumps_bytes(session_id)
+        + b',"payload":'
+        + payload_json
+        + b"}\n\n"
+    )
+
+
+async def with_keepalive(
+    frames: AsyncIterator[bytes],
+    interval: float = SSE_KEEPALIVE_INTERVAL,
+    maxsize: int = SSE_QUEUE_MAXSIZE,
+) -> AsyncIterator[bytes]:
+    """
+    在独立任务中消费 SSE 帧；若 interval 秒内没有新帧，则下发一条注释帧保活，
+    避免 Claude 长时间思考或执行工具时被代理判定为空闲连接而断开。
+
+    队列有界：积压满 maxsize 帧后 pump 会阻塞在 put 上，背压一路传回 SDK 的读取循环。
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    async def pump() -> None:
+        try:
+            async for frame in frames:
+                await queue.put(frame)
+        except Exception as exc:
+            await queue.put(exc)
+        else:
+            await queue.put(_STREAM_END)
+
+    task = asyncio.create_task(pump())
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=interval)
+            except asyncio.TimeoutError:
+                yield SSE_KEEPALIVE_FRAME
+                continue
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+_JSON_SCALARS = (str, int, float, bool)
+
+
+def _public_attrs(value: Any) -> Dict[str, Any]:
+    """对象的公开实例属性；没有 __dict__ 的对象（如只有 __slots__）返回空 dict。
+
+    直接调用 vars() 并捕获 TypeError，省去 hasattr 再 vars 的两次属性查找。
+    """
+    try:
+        attrs = vars(value)
+    except TypeError:
+        return {}
+    return {key: val for key, val in attrs.items() if not key.startswith("_")}
 
 
 def _jsonify(value: Any) -> Any:
-    if value is None or isinstance(value, (str, int, float, bool)):
+    """把 SDK 对象转换成可 JSON 序列化的结构。
+
+    用显式栈代替递归：很深的 tool_result 也不会触发 RecursionError。
+    标量子节点直接写入，只有容器/对象才入栈，省去大部分栈操作。
+    """
+    if value is None or isinstance(value, _JSON_SCALARS):
         return value
-    if isinstance(value, dict):
-        return {str(key): _jsonify(val) for key, val in value.items()}
-    if isinstance(value, (list, tuple, set)):
-        return [_jsonify(item) for item in value]
-    if is_dataclass(value):
-        return _jsonify(asdict(value))
-    if hasattr(value, "__dict__"):
-        data = {
-            key: val for key, val in vars(value).items() if not key.startswith("_")
-        }
-        if data:
-            return {key: _jsonify(val) for key, val in data.items()}
+
+    root: List[Any] = [None]
+    stack: List[Tuple[Any, Any, Any]] = [(root, 0, value)]
+    while stack:
+        target, key, item = stack.pop()
+        if isinstance(item, dict):
+            mapping: Dict[str, Any] = {}
+            target[key] = mapping
+            for child_key, val in item.items():
+                child_key = str(child_key)
+                if val is None or isinstance(val, _JSON_SCALARS):
+                    mapping[child_key] = val
+                else:
+                    # 先占位保证键的顺序与输入一致，稍后由栈回填
+                    mapping[child_key] = None
+                    stack.append((mapping, child_key, val))
+        elif isinstance(item, (list, tuple, set)):
+            container = list(item)
+            target[key] = container
+            for index, val in enumerate(container):
+                if val is not None and not isinstance(val, _JSON_SCALARS):
+                    stack.append((container, index, val))
+        elif is_dataclass(item):
+            stack.append((target, key, asdict(item)))
+        else:
+            data = _public_attrs(item)
+            if data:
+                stack.append((target, key, data))
+            else:
+                target[key] = str(item)
+    return root[0]
+
+
+def _json_default(value: Any) -> Any:
+    """
+    编码器遇到非 JSON 原生类型时的回调，只处理叶子对象；dict/list 仍由 orjson
+    在 C 层一次遍历完成，不再先用 _jsonify 在 Python 里整体复制一遍。
+    """
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if is_dataclass(value) and not isinstance(value, type):
+        return asdict(value)
+    data = _public_attrs(value)
+    if data:
+        return data
     return str(value)
 
 
+def encode_sdk_payload(payload: Dict[str, Any]) -> bytes:
+    """把 _dump_sdk_message 的结果编码为 JSON bytes。"""
+    try:
+        return dumps_bytes(payload, default=_json_default)
+    except (TypeError, ValueError):
+        # 例如 tuple 这类编码器不接受的字典键：退回到完整的 Python 转换
+        return dumps_bytes(_jsonify(payload))
+
+
+def _serialize_text_block(block: TextBlock) -> Dict[str, Any]:
+    return {"type": "text", "text": block.text}
+
+
+def _serialize_thinking_block(block: ThinkingBlock) -> Dict[str, Any]:
+    return {
+        "type": "thinking",
+        "thinking": block.thinking,
+        "signature": block.signature,
+    }
+
+
+def _serialize_tool_use_block(block: ToolUseBlock) -> Dict[str, Any]:
+    return {
+        "type": "tool_use",
+        "id": block.id,
+        "name": block.name,
+        "input": block.input,
+    }
+
+
+def _serialize_tool_result_block(block: ToolResultBlock) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "type": "tool_result",
+        "tool_use_id": block.tool_use_id,
+        "is_error": block.is_error,
+    }
+    if block.content is not None:
+        payload["content"] = block.content
+    return payload
+
+
+def _serialize_mapping(value: Dict[Any, Any]) -> Dict[str, Any]:
+    return dict(value)
+
+
+_CONTENT_BLOCK_SERIALIZERS: Dict[type, Callable[[Any], Dict[str, Any]]] = {
+    TextBlock: _serialize_text_block,
+    ThinkingBlock: _serialize_thinking_block,
+    ToolUseBlock: _serialize_tool_use_block,
+    ToolResultBlock: _serialize_tool_result_block,
+    dict: _serialize_mapping,
+}
+
+
+def _lookup_serializer(
+    table: Dict[type, Callable[[Any], Any]], value: Any
+) -> Optional[Callable[[Any], Any]]:
+    """按 type(value) 查表；未命中时沿 MRO 查找，保持与 isinstance 相同的子类语义。"""
+    cls = type(value)
+    handler = table.get(cls)
+    if handler is None:
+        for base in cls.__mro__[1:]:
+            handler = table.get(base)
+            if handler is not None:
+                break
+    return handler
+
+
 def _serialize_content_block(block: Any) -> Dict[str, Any]:
-    if isinstance(block, TextBlock):
-        return {"type": "text", "text": block.text}
-    if isinstance(block, ThinkingBlock):
-        return {
-            "type": "thinking",
-            "thinking": block.thinking,
-            "signature": block.signature,
-        }
-    if isinstance(block, ToolUseBlock):
-        return {
-            "type": "tool_use",
-            "id": block.id,
-            "name": block.name,
-            "input": _jsonify(block.input),
-        }
-    if isinstance(block, ToolResultBlock):
-        payload: Dict[str, Any] = {
-            "type": "tool_result",
-            "tool_use_id": block.tool_use_id,
-            "is_error": block.is_error,
-        }
-        if block.content is not None:
-            payload["content"] = _jsonify(block.content)
-        return payload
-    if isinstance(block, dict):
-        return {str(key): _jsonify(val) for key, val in block.items()}
+    handler = _lookup_serializer(_CONTENT_BLOCK_SERIALIZERS, block)
+    if handler is not None:
+        return handler(block)
 
     serialized = _jsonify(block)
     if isinstance(serialized, dict):
@@ -83,75 +254,89 @@ def _serialize_content_block(block: Any) -> Dict[str, Any]:
     return {"type": "unknown", "value": serialized}
 
 
-def _serialize_sdk_message(message: Any) -> Optional[Dict[str, Any]]:
-    if isinstance(message, UserMessage):
-        payload: Dict[str, Any] = {
-            "type": "user",
-        }
-        if isinstance(message.content, list):
-            payload["content"] = [
-                _serialize_content_block(block) for block in message.content
-            ]
-        else:
-            payload["content"] = message.content
-        if message.parent_tool_use_id is not None:
-            payload["parent_tool_use_id"] = message.parent_tool_use_id
-        return payload
+def _serialize_user_message(message: UserMessage) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "type": "user",
+    }
+    if isinstance(message.content, list):
+        payload["content"] = [_serialize_content_block(block) for block in message.content]
+    else:
+        payload["content"] = message.content
+    if message.parent_tool_use_id is not None:
+        payload["parent_tool_use_id"] = message.parent_tool_use_id
+    return payload
 
-    if isinstance(message, SystemMessage):
-        payload: Dict[str, Any] = {
-            "type": "system",
-            "subtype": message.subtype,
-            "data": _jsonify(message.data),
-        }
-        session_id = message.data.get("session_id") if isinstance(message.data, dict) else None
-        if isinstance(session_id, str):
-            payload["session_id"] = session_id
-        return payload
 
-    if isinstance(message, AssistantMessage):
-        payload: Dict[str, Any] = {
-            "type": "assistant",
-            "model": message.model,
-            "content": [_serialize_content_block(block) for block in message.content],
-        }
-        if message.parent_tool_use_id is not None:
-            payload["parent_tool_use_id"] = message.parent_tool_use_id
-        return payload
+def _serialize_system_message(message: SystemMessage) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "type": "system",
+        "subtype": message.subtype,
+        "data": message.data,
+    }
+    session_id = message.data.get("session_id") if isinstance(message.data, dict) else None
+    if isinstance(session_id, str):
+        payload["session_id"] = session_id
+    return payload
 
-    if isinstance(message, ResultMessage):
-        payload: Dict[str, Any] = {
-            "type": "result",
-            "subtype": message.subtype,
-            "duration_ms": message.duration_ms,
-            "duration_api_ms": message.duration_api_ms,
-            "is_error": message.is_error,
-            "num_turns": message.num_turns,
-            "session_id": message.session_id,
-        }
-        if message.total_cost_usd is not None:
-            payload["total_cost_usd"] = message.total_cost_usd
-        if message.usage is not None:
-            payload["usage"] = _jsonify(message.usage)
-        if message.result is not None:
-            payload["result"] = message.result
-        return payload
 
-    if _StreamEventType is not None and isinstance(message, _StreamEventType):
-        payload = {
-            "type": "stream_event",
-            "uuid": message.uuid,
-            "session_id": message.session_id,
-            "event": _jsonify(message.event),
-        }
-        if message.parent_tool_use_id is not None:
-            payload["parent_tool_use_id"] = message.parent_tool_use_id
-        return payload
+def _serialize_assistant_message(message: AssistantMessage) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "type": "assistant",
+        "model": message.model,
+        "content": [_serialize_content_block(block) for block in message.content],
+    }
+    if message.parent_tool_use_id is not None:
+        payload["parent_tool_use_id"] = message.parent_tool_use_id
+    return payload
 
-    if isinstance(message, dict):
-        return {str(key): _jsonify(val) for key, val in message.items()}
 
-    return None
+def _serialize_result_message(message: ResultMessage) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "type": "result",
+        "subtype": message.subtype,
+        "duration_ms": message.duration_ms,
+        "duration_api_ms": message.duration_api_ms,
+        "is_error": message.is_error,
+        "num_turns": message.num_turns,
+        "session_id": message.session_id,
+    }
+    if message.total_cost_usd is not None:
+        payload["total_cost_usd"] = message.total_cost_usd
+    if message.usage is not None:
+        payload["usage"] = message.usage
+    if message.result is not None:
+        payload["result"] = message.result
+    return payload
+
+
+def _serialize_stream_event(message: Any) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "type": "stream_event",
+        "uuid": message.uuid,
+        "session_id": message.session_id,
+        "event": message.event,
+    }
+    if message.parent_tool_use_id is not None:
+        payload["parent_tool_use_id"] = message.parent_tool_use_id
+    return payload
+
+
+_SDK_MESSAGE_SERIALIZERS: Dict[type, Callable[[Any], Dict[str, Any]]] = {
+    UserMessage: _serialize_user_message,
+    SystemMessage: _serialize_system_message,
+    AssistantMessage: _serialize_assistant_message,
+    ResultMessage: _serialize_result_message,
+    dict: _serialize_mapping,
+}
+if _StreamEventType is not None:
+    _SDK_MESSAGE_SERIALIZERS[_StreamEventType] = _serialize_stream_event
+
+
+def _serialize_sdk_message(message: Any) -> Optional[Dict[str, Any]]:
+    handler = _lookup_serializer(_SDK_MESSAGE_SERIALIZERS, message)
+    if handler is None:
+        return None
+    return handler(message)
 
 
 def _dump_sdk_message(message: Any) -> Optional[Dict[str, Any]]:
@@ -172,9 +357,18 @@ def _dump_sdk_message(message: Any) -> Optional[Dict[str, Any]]:
     return None
 
 
-def _log_sdk_message(label: str, payload: Dict[str, Any]) -> None:
-    try:
-        serialized = json.dumps(payload, ensure_ascii=False, indent=2)
-    except Exception:
-        serialized = str(payload)
+def _log_sdk_message(
+    label: str, payload: Dict[str, Any], serialized_json: Optional[bytes] = None
+) -> None:
+    # verbose_logs 关闭时直接返回，不再为日志做任何序列化
+    if not ENABLE_VERBOSE_LOGS:
+        return
+    if serialized_json is not None:
+        # 复用发给客户端的那份 JSON，避免为日志再序列化一遍
+        serialized = serialized_json.decode("utf-8")
+    else:
+        try:
+            serialized = dumps_pretty(payload)
+        except Exception:
+            serialized = str(payload)
     print(f"[ClaudeSDK:{label}]\n{serialized}\n", flush=True)
@@ -1,17 +1,33 @@
 from __future__ import annotations
 
-import json
 from typing import Any, Optional
 
+from .cache import TTLCache
 from .database import db_connection
+from .json_codec import JSONDecodeError, dumps, loads
 from .models import UserSettings
 
+# ts_backend 也会直接写共享库里的 user_settings 表，这里只做短 TTL 缓存，且不缓存未命中
+_settings_cache: TTLCache[str, UserSettings] = TTLCache(maxsize=10_000)
+
+_SELECT_USER_SETTINGS_SQL = (
+    "SELECT permission_mode, system_prompt FROM user_settings WHERE user_id = ?"
+)
+
+_UPSERT_USER_SETTINGS_SQL = """
+    INSERT INTO user_settings (user_id, permission_mode, system_prompt)
+    VALUES (?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        permission_mode = excluded.permission_mode,
+        system_prompt = excluded.system_prompt
+"""
+
 
 def _serialize_system_prompt(value: Any) -> Optional[str]:
     if value is None:
         return None
     try:
-        return json.dumps(value, ensure_ascii=False)
+        return dumps(value)
     except (TypeError, ValueError) as exc:  # pragma: no cover - invalid payloads
         raise ValueError("system_prompt is not JSON serializable") from exc
 
@@ -20,26 +36,32 @@ def _deserialize_system_prompt(raw: Optional[str]) -> Any:
     if raw is None:
         return None
     try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
+        return loads(raw)
+    except JSONDecodeError:
         return raw
 
 
 def fetch_user_settings(user_id: str) -> Optional[UserSettings]:
+    cached = _settings_cache.get(user_id)
+    if cached is not None:
+        return cached
+
     with db_connection() as conn:
-        row = conn.execute(
-            "SELECT user_id, permission_mode, system_prompt FROM user_settings WHERE user_id = ?",
-            (user_id,),
-        ).fetchone()
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        row = cursor.execute(_SELECT_USER_SETTINGS_SQL, (user_id,)).fetchone()
 
     if row is None:
         return None
 
-    return UserSettings(
-        user_id=row["user_id"],
-        permission_mode=row["permission_mode"],
-        system_prompt=_deserialize_system_prompt(row["system_prompt"]),
+    permission_mode, raw_system_prompt = row
+    settings = UserSettings.model_construct(
+        user_id=user_id,
+        permission_mode=permission_mode,
+        system_prompt=_deserialize_system_prompt(raw_system_prompt),
     )
+    _settings_cache.set(user_id, settings)
+    return settings
 
 
 def upsert_user_settings(
@@ -49,18 +71,13 @@ def upsert_user_settings(
 
     with db_connection() as conn:
         conn.execute(
-            """
-            INSERT INTO user_settings (user_id, permission_mode, system_prompt)
-            VALUES (?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                permission_mode = excluded.permission_mode,
-                system_prompt = excluded.system_prompt
-            """,
-            (user_id, permission_mode, serialized_prompt),
+            _UPSERT_USER_SETTINGS_SQL, (user_id, permission_mode, serialized_prompt)
         )
 
-    return UserSettings(
+    settings = UserSettings(
         user_id=user_id,
         permission_mode=permission_mode,
         system_prompt=system_prompt,
     )
+    _settings_cache.set(user_id, settings)
+    return settings
@@ -0,0 +1,66 @@
+"""Shared config.yaml access for the dev_tests scripts."""
+
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+CONFIG_PATH = PROJECT_ROOT / "config.yaml"
+_FALLBACK_AUTH = ("admin", "642531")
+
+
+@lru_cache(maxsize=8)
+def _read_config(path: str, mtime_ns: int, size: int, ino: int) -> Any:
+    # The stat fields are only part of the cache key: editing config.yaml
+    # changes them and forces a fresh parse.
+    import yaml  # Deferred so scripts that never read the config skip the import.
+
+    # Prefer the libyaml-backed loader; fall back when PyYAML was built without it.
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    try:
+        with open(path, "r", encoding="utf-8") as handler:
+            return yaml.load(handler, Loader=loader) or {}
+    except (FileNotFoundError, yaml.YAMLError):
+        return {}
+
+
+def load_config() -> Any:
+    """Return the parsed config.yaml, re-parsing only when the file changes."""
+    try:
+        stat = os.stat(CONFIG_PATH)
+    except FileNotFoundError:
+        return {}
+    return _read_config(str(CONFIG_PATH), stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _auth_from_config(data: Any) -> tuple[str, str]:
+    if isinstance(data, dict):
+        users = data.get("users")
+        if isinstance(users, dict):
+            for username, password in users.items():
+                if isinstance(username, str) and isinstance(password, str):
+                    return username, password
+
+    return _FALLBACK_AUTH
+
+
+def load_default_auth() -> tuple[str, str]:
+    """Return the first username/password pair from config.yaml."""
+    return _auth_from_config(load_config())
+
+
+def resolve_auth(username: Optional[str], password: Optional[str]) -> tuple[str, str]:
+    """Fill in whichever of username/password was not given from config.yaml.
+
+    Scripts call this after parse_args() so ``--help`` never reads the config.
+    """
+    if username is None or password is None:
+        default_username, default_password = load_default_auth()
+        if username is None:
+            username = default_username
+        if password is None:
+            password = default_password
+    return username, password
@@ -0,0 +1,120 @@
+"""SSE parsing, JSON encoding and console output helpers shared by the dev_tests scripts."""
+
+from __future__ import annotations
+
+import json
+import sys
+from typing import TYPE_CHECKING, Any, AsyncIterator, Optional
+
+if TYPE_CHECKING:
+    import httpx
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+    _json_dumps_bytes = orjson.dumps
+
+    def dumps_pretty(value: Any) -> str:
+        """Two-space indented JSON text for console output."""
+        return orjson.dumps(
+            value, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+        ).decode("utf-8")
+
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps_bytes(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def dumps_pretty(value: Any) -> str:
+        """Two-space indented JSON text for console output."""
+        return json.dumps(value, ensure_ascii=False, indent=2)
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Streamed token text is written to stdout once this many characters are
+# buffered, instead of one flushed print per token.
+TOKEN_FLUSH_CHARS = 512
+# Event names the servers emit, mapped to interned str so most frames skip the
+# decode and the callers' ``event_type == "token"`` checks hit the identity fast path.
+_EVENT_NAMES = {
+    name.encode("ascii"): name
+    for name in ("session", "token", "message", "done", "error", "stopped", "run")
+}
+
+
+def encode_json_body(payload: Any) -> bytes:
+    """Encode a request body once, as UTF-8 JSON, for ``content=`` + JSON_HEADERS.
+
+    httpx's ``json=`` goes through the stdlib encoder with ensure_ascii, which
+    escapes every non-ASCII character of the (often Chinese) message.
+    """
+    return _json_dumps_bytes(payload)
+
+
+class TokenWriter:
+    """Buffer streamed token text and write it to stdout in batches.
+
+    Call flush() before printing anything else so the output stays in order.
+    """
+
+    def __init__(self) -> None:
+        self._pending: list[str] = []
+        self._pending_len = 0
+
+    def write(self, text: str) -> None:
+        self._pending.append(text)
+        self._pending_len += len(text)
+        if self._pending_len >= TOKEN_FLUSH_CHARS:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending:
+            sys.stdout.write("".join(self._pending))
+            sys.stdout.flush()
+            self._pending.clear()
+            self._pending_len = 0
+
+
+def _parse_sse_frame(frame: bytes) -> Optional[tuple[Optional[str], Any]]:
+    event: Optional[str] = None
+    data: Optional[bytes] = None
+    for line in frame.split(b"\n"):
+        if not line:
+            continue
+        # The servers only emit "event: ", "data: " and ": ping" lines, so the
+        # first byte is enough to classify them.
+        first = line[0]
+        if first == 0x64:  # b"d" -> "data: "
+            data = line[6:]
+        elif first == 0x65:  # b"e" -> "event: "
+            name = line[7:]
+            event = _EVENT_NAMES.get(name) or name.decode("utf-8")
+    if data is None:
+        # Comment frames such as keepalive pings carry no data.
+        return None
+    try:
+        return event, _json_loads(data)
+    except ValueError:
+        return event, data.decode("utf-8", errors="replace")
+
+
+async def iter_sse(resp: httpx.Response) -> AsyncIterator[tuple[Optional[str], Any]]:
+    """Yield (event, data) pairs parsed straight from the response bytes.
+
+    data is the decoded JSON payload, or the raw text when it is not JSON.
+    """
+    buffer = bytearray()
+    async for chunk in resp.aiter_bytes():
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n\n", start)
+            if end < 0:
+                break
+            parsed = _parse_sse_frame(bytes(buffer[start:end]))
+            start = end + 2
+            if parsed is not None:
+                yield parsed
+        if start:
+            del buffer[:start]
@@ -6,12 +6,14 @@ import argparse
 import asyncio
 import base64
 import json
+from functools import lru_cache
 from io import BytesIO
-from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
 
 import httpx
-import yaml
+
+from _config import PROJECT_ROOT, load_default_auth
+from _sse import JSON_HEADERS, TokenWriter, encode_json_body, iter_sse
 
 try:
     from PIL import Image, ImageDraw, ImageFont
@@ -19,30 +21,20 @@ except ImportError:
     print("Warning: PIL/Pillow not installed. Using fallback image generation.")
     Image = None
 
-PROJECT_ROOT = Path(__file__).resolve().parent.parent
-CONFIG_PATH = PROJECT_ROOT / "config.yaml"
-
-
-def _load_default_auth() -> tuple[str, str]:
-    try:
-        with CONFIG_PATH.open("r", encoding="utf-8") as handler:
-            data = yaml.safe_load(handler) or {}
-    except FileNotFoundError:
-        data = {}
-    except yaml.YAMLError:
-        data = {}
+TEST_IMAGE_CACHE_PATH = PROJECT_ROOT / ".cache" / "demo_test_image.png"
 
-    if isinstance(data, dict):
-        users = data.get("users")
-        if isinstance(users, dict):
-            for username, password in users.items():
-                if isinstance(username, str) and isinstance(password, str):
-                    return username, password
+DEFAULT_USERNAME, DEFAULT_PASSWORD = load_default_auth()
 
-    return "admin", "642531"
 
-
-DEFAULT_USERNAME, DEFAULT_PASSWORD = _load_default_auth()
+@lru_cache(maxsize=1)
+def _load_font() -> Any:
+    """Load the label font once; arial.ttf is usually missing off Windows."""
+    try:
+        # Try to use a default font
+        return ImageFont.truetype("arial.ttf", 24)
+    except Exception:
+        # Fall back to default font
+        return ImageFont.load_default()
 
 
 def create_test_image() -> bytes:
@@ -55,38 +47,44 @@ def create_test_image() -> bytes:
         )
         return minimal_png
 
-    # Create a 400x300 image with a gradient and text
-    img = Image.new("RGB", (400, 300), color=(240, 240, 240))
+    # The generated image is deterministic, so reuse the PNG from a previous run.
+    try:
+        return TEST_IMAGE_CACHE_PATH.read_bytes()
+    except OSError:
+        pass
+
+    # Create a 400x300 image with a gradient and text. The gradient is built
+    # as raw RGB rows in one buffer instead of one rectangle draw per row.
+    width, height = 400, 300
+    pixels = b"".join(
+        bytes((100, 150, int(255 * (y / height)))) * width for y in range(height)
+    )
+    img = Image.frombytes("RGB", (width, height), pixels)
     draw = ImageDraw.Draw(img)
 
-    # Draw a gradient background
-    for y in range(300):
-        color = int(255 * (y / 300))
-        draw.rectangle([(0, y), (400, y + 1)], fill=(100, 150, color))
-
     # Draw some shapes
     draw.ellipse([50, 50, 150, 150], fill=(255, 100, 100), outline=(200, 50, 50))
     draw.rectangle([200, 100, 350, 200], fill=(100, 255, 100), outline=(50, 200, 50))
 
     # Add text
-    try:
-        # Try to use a default font
-        font = ImageFont.truetype("arial.ttf", 24)
-    except Exception:
-        # Fall back to default font
-        font = ImageFont.load_default()
-
+    font = _load_font()
     draw.text((50, 220), "Test Image for Claude", fill=(0, 0, 0), font=font)
 
     # Convert to bytes
     buffer = BytesIO()
-    img.save(buffer, format="PNG")
-    return buffer.getvalue()
+    img.save(buffer, format="PNG", compress_level=1)
+    image_bytes = buffer.getvalue()
+    try:
+        TEST_IMAGE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        TEST_IMAGE_CACHE_PATH.write_bytes(image_bytes)
+    except OSError:
+        pass
+    return image_bytes
 
 
 def image_to_base64(image_bytes: bytes) -> str:
     """Convert image bytes to base64 string."""
-    return base64.b64encode(image_bytes).decode("utf-8")
+    return base64.b64encode(image_bytes).decode("ascii")
 
 
 def load_image_from_file(image_path: str) -> bytes:
@@ -172,7 +170,10 @@ async def stream_chat_with_image(
     collected_text: list[str] = []
 
     async with httpx.AsyncClient(timeout=None, auth=auth) as client:
-        async with client.stream("POST", url, json=payload) as resp:
+        # Encode the (image-heavy) payload once ourselves instead of letting
+        # httpx run it through the stdlib encoder.
+        body = encode_json_body(payload)
+        async with client.stream("POST", url, content=body, headers=JSON_HEADERS) as resp:
             if resp.status_code != 200:
                 error_text = await resp.aread()
                 print(f"[ERROR] Status: {resp.status_code}")
@@ -180,35 +181,20 @@ async def stream_chat_with_image(
                 resp.raise_for_status()
             print("[STREAM] Streaming events:\n")
 
-            event_type: Optional[str] = None
-            async for raw_line in resp.aiter_lines():
-                if raw_line is None:
-                    continue
-                line = raw_line.strip()
-                if not line:
-                    continue
-
-                if line.startswith("event:"):
-                    event_type = line.split("event:", 1)[1].strip()
-                    print(f"event: {event_type}")
-                    continue
-
-                if not line.startswith("data:"):
+            tokens = TokenWriter()
+            async for event_type, data_obj in iter_sse(resp):
+                if event_type == "token":
+                    chunk = data_obj.get("text") or ""
+                    collected_text.append(chunk)
+                    tokens.write(chunk)
                     continue
 
-                data_str = line.split("data:", 1)[1].strip()
-                try:
-                    data_obj = json.loads(data_str)
-                except json.JSONDecodeError:
-                    data_obj = data_str
+                tokens.flush()
+                print(f"event: {event_type}")
 
                 if event_type == "session":
                     final_session_id = data_obj.get("session_id") or final_session_id
                     print(f"data: {json.dumps(data_obj, ensure_ascii=False)}")
-                elif event_type == "token":
-                    chunk = data_obj.get("text") or ""
-                    collected_text.append(chunk)
-                    print(chunk, end="", flush=True)
                 elif event_type == "message":
                     # Skip detailed message payload for cleaner output
                     payload_session = data_obj.get("session_id")
@@ -221,9 +207,11 @@ async def stream_chat_with_image(
                 elif event_type == "run":
                     print(f"data: {json.dumps(data_obj, ensure_ascii=False)}")
 
-                if event_type not in ("token", "message"):
+                if event_type != "message":
                     print()
 
+            tokens.flush()
+
     if not final_session_id:
         raise RuntimeError("Did not receive session_id from /chat stream")
 
@@ -5,36 +5,15 @@ from __future__ import annotations
 import argparse
 import asyncio
 import json
-from pathlib import Path
 from typing import Optional
 
 import httpx
-import yaml
 
-PROJECT_ROOT = Path(__file__).resolve().parent.parent
-CONFIG_PATH = PROJECT_ROOT / "config.yaml"
+from _config import PROJECT_ROOT, load_default_auth
+from _sse import JSON_HEADERS, encode_json_body, iter_sse
 
 
-def _load_default_auth() -> tuple[str, str]:
-    try:
-        with CONFIG_PATH.open("r", encoding="utf-8") as handler:
-            data = yaml.safe_load(handler) or {}
-    except FileNotFoundError:
-        data = {}
-    except yaml.YAMLError:
-        data = {}
-
-    if isinstance(data, dict):
-        users = data.get("users")
-        if isinstance(users, dict):
-            for username, password in users.items():
-                if isinstance(username, str) and isinstance(password, str):
-                    return username, password
-
-    return "admin", "642531"
-
-
-DEFAULT_USERNAME, DEFAULT_PASSWORD = _load_default_auth()
+DEFAULT_USERNAME, DEFAULT_PASSWORD = load_default_auth()
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -63,12 +42,11 @@ def build_parser() -> argparse.ArgumentParser:
     return parser
 
 
-async def fetch_default_session(base_url: str, auth: httpx.Auth) -> Optional[dict]:
+async def fetch_default_session(client: httpx.AsyncClient, base_url: str) -> Optional[dict]:
     url = f"{base_url.rstrip('/')}/sessions"
-    async with httpx.AsyncClient(timeout=30.0, auth=auth) as client:
-        resp = await client.get(url)
-        resp.raise_for_status()
-        sessions = resp.json()
+    resp = await client.get(url, timeout=30.0)
+    resp.raise_for_status()
+    sessions = resp.json()
 
     if isinstance(sessions, list) and sessions:
         return sessions[0]
@@ -76,13 +54,13 @@ async def fetch_default_session(base_url: str, auth: httpx.Auth) -> Optional[dic
 
 
 async def stream_chat(
+    client: httpx.AsyncClient,
     *,
     base_url: str,
     message: str,
     cwd: str,
     permission_mode: str,
     session_id: Optional[str],
-    auth: httpx.Auth,
 ) -> str:
     payload = {"message": message, "permission_mode": permission_mode}
     if session_id:
@@ -97,47 +75,29 @@ async def stream_chat(
     final_session_id: Optional[str] = session_id
     collected_text: list[str] = []
 
-    async with httpx.AsyncClient(timeout=None, auth=auth) as client:
-        async with client.stream("POST", url, json=payload) as resp:
-            resp.raise_for_status()
-            print("📥 Streaming events:\n")
-
-            event_type: Optional[str] = None
-            async for raw_line in resp.aiter_lines():
-                if raw_line is None:
-                    continue
-                line = raw_line.strip()
-                if not line:
-                    continue
-
-                if line.startswith("event:"):
-                    event_type = line.split("event:", 1)[1].strip()
-                    print(f"event: {event_type}")
-                    continue
-
-                if not line.startswith("data:"):
-                    continue
-
-                data_str = line.split("data:", 1)[1].strip()
-                try:
-                    data_obj = json.loads(data_str)
-                except json.JSONDecodeError:
-                    data_obj = data_str
-
-                print("data:", json.dumps(data_obj, ensure_ascii=False, indent=2))
-
-                if event_type == "session":
-                    final_session_id = data_obj.get("session_id") or final_session_id
-                elif event_type == "token":
-                    chunk = data_obj.get("text") or ""
-                    collected_text.append(chunk)
-                elif event_type == "message":
-                    payload_session = data_obj.get("session_id")
-                    print(f"   ↳ message payload for session {payload_session}")
-                elif event_type == "error":
-                    raise RuntimeError(f"服务器返回错误: {data_obj}")
-
-                print()
+    async with client.stream(
+        "POST", url, content=encode_json_body(payload), headers=JSON_HEADERS
+    ) as resp:
+        resp.raise_for_status()
+        print("📥 Streaming events:\n")
+
+        async for event_type, data_obj in iter_sse(resp):
+            print(f"event: {event_type}")
+
+            print("data:", json.dumps(data_obj, ensure_ascii=False, indent=2))
+
+            if event_type == "session":
+                final_session_id = data_obj.get("session_id") or final_session_id
+            elif event_type == "token":
+                chunk = data_obj.get("text") or ""
+                collected_text.append(chunk)
+            elif event_type == "message":
+                payload_session = data_obj.get("session_id")
+                print(f"   ↳ message payload for session {payload_session}")
+            elif event_type == "error":
+                raise RuntimeError(f"服务器返回错误: {data_obj}")
+
+            print()
 
     if not final_session_id:
         raise RuntimeError("未从 /chat 流中获取 session_id")
@@ -152,26 +112,33 @@ async def stream_chat(
     return final_session_id
 
 
-async def fetch_session_detail(base_url: str, session_id: str, auth: httpx.Auth) -> dict:
+async def fetch_session_detail(
+    client: httpx.AsyncClient, base_url: str, session_id: str
+) -> dict:
     url = f"{base_url.rstrip('/')}/sessions/{session_id}"
-    async with httpx.AsyncClient(timeout=60.0, auth=auth) as client:
-        resp = await client.get(url)
-        resp.raise_for_status()
-        return resp.json()
+    resp = await client.get(url, timeout=60.0)
+    resp.raise_for_status()
+    return resp.json()
 
 
 async def main_async() -> None:
     args = build_parser().parse_args()
 
     auth = httpx.BasicAuth(args.username, args.password)
+    # One client for the whole run so the /sessions, /chat and detail requests
+    # reuse the same keep-alive connection.
+    async with httpx.AsyncClient(timeout=None, auth=auth) as client:
+        await run_demo(client, args)
+
 
+async def run_demo(client: httpx.AsyncClient, args: argparse.Namespace) -> None:
     session_id: Optional[str] = args.session_id
     cwd: Optional[str] = args.cwd
 
     default_session: Optional[dict] = None
     if session_id is None or cwd is None:
         try:
-            default_session = await fetch_default_session(args.base_url, auth)
+            default_session = await fetch_default_session(client, args.base_url)
         except httpx.HTTPError as exc:
             print(f"⚠️ 无法从 /sessions 获取默认会话: {exc}")
 
@@ -191,15 +158,15 @@ async def main_async() -> None:
             print(f"ℹ️ 未指定 cwd，使用项目根目录: {cwd}")
 
     session_id = await stream_chat(
+        client,
         base_url=args.base_url,
         message=args.message,
         cwd=cwd,
         permission_mode=args.permission_mode,
         session_id=session_id,
-        auth=auth,
     )
 
-    detail = await fetch_session_detail(args.base_url, session_id, auth)
+    detail = await fetch_session_detail(client, args.base_url, session_id)
     print("📄 /sessions/{id} 概览：")
     print(f"   title = {detail['title']}")
     print(f"   cwd   = {detail['cwd']}")
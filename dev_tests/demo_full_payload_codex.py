@@ -5,34 +5,16 @@ from __future__ import annotations
 import argparse
 import asyncio
 import json
-from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-import httpx
-import yaml
+from _config import PROJECT_ROOT, resolve_auth
+from _sse import JSON_HEADERS, dumps_pretty, encode_json_body, iter_sse
 
-PROJECT_ROOT = Path(__file__).resolve().parent.parent
-CONFIG_PATH = PROJECT_ROOT / "config.yaml"
+if TYPE_CHECKING:
+    # httpx is imported where it is used so `--help` does not pay for it.
+    import httpx
 
-
-def _load_default_auth() -> tuple[str, str]:
-    try:
-        with CONFIG_PATH.open("r", encoding="utf-8") as handler:
-            data = yaml.safe_load(handler) or {}
-    except (FileNotFoundError, yaml.YAMLError):
-        data = {}
-
-    if isinstance(data, dict):
-        users = data.get("users")
-        if isinstance(users, dict):
-            for username, password in users.items():
-                if isinstance(username, str) and isinstance(password, str):
-                    return username, password
-
-    return "admin", "642531"
-
-
-DEFAULT_USERNAME, DEFAULT_PASSWORD = _load_default_auth()
+_PREVIEW_CHARS = 200
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -41,8 +23,8 @@ def build_parser() -> argparse.ArgumentParser:
     parser.add_argument("--message", default="列出当前目录的文件并说明用途")
     parser.add_argument("--cwd", default=None, help="默认自动读取 /codex/sessions 的 cwd")
     parser.add_argument("--session-id", default=None, help="继续 Codex 会话时使用的 session_id")
-    parser.add_argument("--username", default=DEFAULT_USERNAME, help="HTTP Basic 用户名")
-    parser.add_argument("--password", default=DEFAULT_PASSWORD, help="HTTP Basic 密码")
+    parser.add_argument("--username", default=None, help="HTTP Basic 用户名（默认读取 config.yaml）")
+    parser.add_argument("--password", default=None, help="HTTP Basic 密码（默认读取 config.yaml）")
     parser.add_argument("--approval-policy", default=None, choices=["never", "on-request", "on-failure", "untrusted"])
     parser.add_argument("--sandbox-mode", default=None, choices=["read-only", "workspace-write", "danger-full-access"])
     parser.add_argument("--model", default=None)
@@ -51,26 +33,24 @@ def build_parser() -> argparse.ArgumentParser:
     parser.add_argument("--web-search", action="store_true", help="为 Codex 开启 Web 搜索")
     parser.add_argument("--skip-git-repo-check", action="store_true", help="跳过 Codex 的 Git 仓库检查")
     parser.add_argument("--show-session-json", action="store_true", help="打印 `/codex/sessions/{id}` 的完整 JSON")
+    parser.add_argument("--verbose", action="store_true", help="同时打印每个 token 事件的 JSON")
     return parser
 
 
-async def fetch_default_codex_session(base_url: str, auth: httpx.Auth) -> Optional[dict]:
+async def fetch_default_codex_session(
+    client: httpx.AsyncClient, base_url: str
+) -> Optional[dict]:
     url = f"{base_url.rstrip('/')}/codex/sessions"
-    async with httpx.AsyncClient(timeout=30.0, auth=auth) as client:
-        resp = await client.get(url)
-        resp.raise_for_status()
-        sessions = resp.json()
+    resp = await client.get(url, timeout=30.0)
+    resp.raise_for_status()
+    sessions = resp.json()
     if isinstance(sessions, list) and sessions:
         return sessions[0]
     return None
 
 
-def _append_optional(payload: dict, key: str, value) -> None:
-    if value is not None:
-        payload[key] = value
-
-
 async def stream_codex_chat(
+    client: httpx.AsyncClient,
     *,
     base_url: str,
     message: str,
@@ -83,7 +63,7 @@ async def stream_codex_chat(
     network_access: bool,
     web_search: bool,
     skip_git_repo_check: bool,
-    auth: httpx.Auth,
+    verbose: bool = False,
 ) -> str:
     payload: dict[str, object] = {"message": message}
     if session_id:
@@ -91,10 +71,16 @@ async def stream_codex_chat(
     else:
         payload["cwd"] = cwd
 
-    _append_optional(payload, "approval_policy", approval_policy)
-    _append_optional(payload, "sandbox_mode", sandbox_mode)
-    _append_optional(payload, "model", model)
-    _append_optional(payload, "model_reasoning_effort", model_reasoning_effort)
+    payload.update(
+        (key, value)
+        for key, value in (
+            ("approval_policy", approval_policy),
+            ("sandbox_mode", sandbox_mode),
+            ("model", model),
+            ("model_reasoning_effort", model_reasoning_effort),
+        )
+        if value is not None
+    )
     if network_access:
         payload["network_access_enabled"] = True
     if web_search:
@@ -107,43 +93,33 @@ async def stream_codex_chat(
     print(f"[post] payload = {json.dumps(payload, ensure_ascii=False)}\n")
 
     final_session_id: Optional[str] = session_id
-    collected_text: list[str] = []
-
-    async with httpx.AsyncClient(timeout=None, auth=auth) as client:
-        async with client.stream("POST", url, json=payload) as resp:
-            resp.raise_for_status()
-            print("[stream] streaming events:\n")
-
-            event_type: Optional[str] = None
-            async for raw_line in resp.aiter_lines():
-                if raw_line is None:
-                    continue
-                line = raw_line.strip()
-                if not line:
-                    continue
-
-                if line.startswith("event:"):
-                    event_type = line.split("event:", 1)[1].strip()
-                    print(f"event: {event_type}")
-                    continue
-
-                if not line.startswith("data:"):
-                    continue
-
-                data_str = line.split("data:", 1)[1].strip()
-                try:
-                    data_obj = json.loads(data_str)
-                except json.JSONDecodeError:
-                    data_obj = data_str
-
-                print("data:", json.dumps(data_obj, ensure_ascii=False, indent=2))
-                if event_type == "session":
-                    final_session_id = data_obj.get("session_id") or final_session_id
-                elif event_type == "token":
+    # Only the first _PREVIEW_CHARS characters are printed, so stop keeping
+    # token text once that much has been collected.
+    preview_parts: list[str] = []
+    preview_len = 0
+
+    async with client.stream(
+        "POST", url, content=encode_json_body(payload), headers=JSON_HEADERS
+    ) as resp:
+        resp.raise_for_status()
+        print("[stream] streaming events:\n")
+
+        async for event_type, data_obj in iter_sse(resp):
+            # Token events are the bulk of the stream; only echo them with --verbose.
+            echo = verbose or event_type != "token"
+            if echo:
+                print(f"event: {event_type}")
+                print("data:", dumps_pretty(data_obj))
+            if event_type == "session":
+                final_session_id = data_obj.get("session_id") or final_session_id
+            elif event_type == "token":
+                if preview_len < _PREVIEW_CHARS:
                     chunk = data_obj.get("text") or ""
-                    collected_text.append(chunk)
-                elif event_type == "error":
-                    raise RuntimeError(f"服务器返回错误: {data_obj}")
+                    preview_parts.append(chunk)
+                    preview_len += len(chunk)
+            elif event_type == "error":
+                raise RuntimeError(f"服务器返回错误: {data_obj}")
+            if echo:
                 print()
 
     if not final_session_id:
@@ -151,25 +127,36 @@ async def stream_codex_chat(
 
     print("[done] Codex 流式对话完成")
     print(f"   session_id = {final_session_id}")
-    if collected_text:
-        preview = "".join(collected_text)
-        print(f"   文本预览（前 200 字符）: {preview[:200]!r}")
+    if preview_parts:
+        preview = "".join(preview_parts)[:_PREVIEW_CHARS]
+        print(f"   文本预览（前 {_PREVIEW_CHARS} 字符）: {preview!r}")
     print()
 
     return final_session_id
 
 
-async def fetch_codex_session_detail(base_url: str, session_id: str, auth: httpx.Auth) -> dict:
+async def fetch_codex_session_detail(
+    client: httpx.AsyncClient, base_url: str, session_id: str
+) -> dict:
     url = f"{base_url.rstrip('/')}/codex/sessions/{session_id}"
-    async with httpx.AsyncClient(timeout=60.0, auth=auth) as client:
-        resp = await client.get(url)
-        resp.raise_for_status()
-        return resp.json()
+    resp = await client.get(url, timeout=60.0)
+    resp.raise_for_status()
+    return resp.json()
 
 
 async def main_async() -> None:
     args = build_parser().parse_args()
-    auth = httpx.BasicAuth(args.username, args.password)
+    import httpx
+
+    auth = httpx.BasicAuth(*resolve_auth(args.username, args.password))
+    # One client for the whole run so the session lookup, the chat stream and
+    # the detail fetch share keep-alive connections.
+    async with httpx.AsyncClient(timeout=None, auth=auth) as client:
+        await run_demo(client, args)
+
+
+async def run_demo(client: httpx.AsyncClient, args: argparse.Namespace) -> None:
+    import httpx
 
     session_id: Optional[str] = args.session_id
     cwd: Optional[str] = args.cwd
@@ -177,7 +164,7 @@ async def main_async() -> None:
     default_session: Optional[dict] = None
     if session_id is None or cwd is None:
         try:
-            default_session = await fetch_default_codex_session(args.base_url, auth)
+            default_session = await fetch_default_codex_session(client, args.base_url)
         except httpx.HTTPError as exc:
             print(f"[warn] 无法通过 /codex/sessions 获取默认会话: {exc}")
 
@@ -193,6 +180,7 @@ async def main_async() -> None:
             print("[warn] 未发现可用会话，使用项目根目录启动新会话")
 
     session_id = await stream_codex_chat(
+        client,
         base_url=args.base_url,
         message=args.message,
         cwd=cwd,
@@ -204,17 +192,17 @@ async def main_async() -> None:
         network_access=args.network_access,
         web_search=args.web_search,
         skip_git_repo_check=args.skip_git_repo_check,
-        auth=auth,
+        verbose=args.verbose,
     )
 
-    detail = await fetch_codex_session_detail(args.base_url, session_id, auth)
+    detail = await fetch_codex_session_detail(client, args.base_url, session_id)
     print("[summary] /codex/sessions/{id} 概览:")
     print(f"   title = {detail['title']}")
     print(f"   cwd   = {detail['cwd']}")
     print(f"   messages = {len(detail.get('messages', []))} 条\n")
 
     if args.show_session_json:
-        print(json.dumps(detail, ensure_ascii=False, indent=2))
+        print(dumps_pretty(detail))
 
 
 def main() -> None:
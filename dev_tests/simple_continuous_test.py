@@ -5,12 +5,12 @@ Simple test for continuous messaging - manually sends two messages.
 from __future__ import annotations
 
 import asyncio
-import json
 import sys
-from pathlib import Path
 
 import httpx
-import yaml
+
+from _config import PROJECT_ROOT, load_default_auth
+from _sse import JSON_HEADERS, TokenWriter, encode_json_body, iter_sse
 
 # Fix Windows console encoding issues
 if sys.platform == "win32":
@@ -20,28 +20,7 @@ if sys.platform == "win32":
     except AttributeError:
         pass
 
-PROJECT_ROOT = Path(__file__).resolve().parent.parent
-CONFIG_PATH = PROJECT_ROOT / "config.yaml"
-
-
-def _load_default_auth() -> tuple[str, str]:
-    try:
-        with CONFIG_PATH.open("r", encoding="utf-8") as handler:
-            data = yaml.safe_load(handler) or {}
-    except (FileNotFoundError, yaml.YAMLError):
-        data = {}
-
-    if isinstance(data, dict):
-        users = data.get("users")
-        if isinstance(users, dict):
-            for username, password in users.items():
-                if isinstance(username, str) and isinstance(password, str):
-                    return username, password
-
-    return "admin", "642531"
-
-
-DEFAULT_USERNAME, DEFAULT_PASSWORD = _load_default_auth()
+DEFAULT_USERNAME, DEFAULT_PASSWORD = load_default_auth()
 
 
 async def send_message(client: httpx.AsyncClient, message: str, session_id: str | None, cwd: str | None):
@@ -61,43 +40,29 @@ async def send_message(client: httpx.AsyncClient, message: str, session_id: str
     url = "http://127.0.0.1:8207/chat"
     captured_session_id = session_id
     token_count = 0
+    tokens = TokenWriter()
 
-    async with client.stream("POST", url, json=payload) as resp:
+    async with client.stream(
+        "POST", url, content=encode_json_body(payload), headers=JSON_HEADERS
+    ) as resp:
         resp.raise_for_status()
         run_id = resp.headers.get("X-Claude-Run-Id")
         print(f"Run ID: {run_id}\n")
 
-        event_type = None
-        async for raw_line in resp.aiter_lines():
-            if not raw_line:
-                continue
-            line = raw_line.strip()
-            if not line:
-                continue
-
-            if line.startswith("event:"):
-                event_type = line.split("event:", 1)[1].strip()
-                continue
-
-            if not line.startswith("data:"):
+        async for event_type, data_obj in iter_sse(resp):
+            if event_type == "token" and isinstance(data_obj, dict):
+                text = data_obj.get("text", "")
+                tokens.write(text)
+                token_count += 1
                 continue
 
-            data_str = line.split("data:", 1)[1].strip()
-            try:
-                data_obj = json.loads(data_str)
-            except json.JSONDecodeError:
-                data_obj = data_str
+            tokens.flush()
 
             if event_type == "session" and isinstance(data_obj, dict):
                 captured_session_id = data_obj.get("session_id")
                 is_new = data_obj.get("is_new", False)
                 print(f"[session] ID={captured_session_id}, new={is_new}")
 
-            elif event_type == "token" and isinstance(data_obj, dict):
-                text = data_obj.get("text", "")
-                print(text, end="", flush=True)
-                token_count += 1
-
             elif event_type == "done":
                 print(f"\n\n[done] Tokens: {token_count}")
                 break
@@ -106,6 +71,8 @@ async def send_message(client: httpx.AsyncClient, message: str, session_id: str
                 print(f"\n[error] {data_obj.get('message') if isinstance(data_obj, dict) else data_obj}")
                 break
 
+    tokens.flush()
+
     return captured_session_id
 
 
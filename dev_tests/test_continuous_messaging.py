@@ -16,13 +16,13 @@ from __future__ import annotations
 
 import argparse
 import asyncio
-import json
 import sys
-from pathlib import Path
 from typing import Optional
 
 import httpx
-import yaml
+
+from _config import PROJECT_ROOT, load_default_auth
+from _sse import TokenWriter, iter_sse
 
 # Fix Windows console encoding issues
 if sys.platform == "win32":
@@ -32,28 +32,7 @@ if sys.platform == "win32":
     except AttributeError:
         pass
 
-PROJECT_ROOT = Path(__file__).resolve().parent.parent
-CONFIG_PATH = PROJECT_ROOT / "config.yaml"
-
-
-def _load_default_auth() -> tuple[str, str]:
-    try:
-        with CONFIG_PATH.open("r", encoding="utf-8") as handler:
-            data = yaml.safe_load(handler) or {}
-    except (FileNotFoundError, yaml.YAMLError):
-        data = {}
-
-    if isinstance(data, dict):
-        users = data.get("users")
-        if isinstance(users, dict):
-            for username, password in users.items():
-                if isinstance(username, str) and isinstance(password, str):
-                    return username, password
-
-    return "admin", "642531"
-
-
-DEFAULT_USERNAME, DEFAULT_PASSWORD = _load_default_auth()
+DEFAULT_USERNAME, DEFAULT_PASSWORD = load_default_auth()
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -81,25 +60,22 @@ def build_parser() -> argparse.ArgumentParser:
     return parser
 
 
-async def fetch_default_session(base_url: str, auth: httpx.Auth) -> Optional[dict]:
+async def fetch_default_session(client: httpx.AsyncClient) -> Optional[dict]:
     """Fetch an existing session to get default cwd."""
-    url = f"{base_url.rstrip('/')}/sessions"
-    async with httpx.AsyncClient(timeout=10.0, auth=auth) as client:
-        resp = await client.get(url)
-        resp.raise_for_status()
-        sessions = resp.json()
+    resp = await client.get("/sessions", timeout=10.0)
+    resp.raise_for_status()
+    sessions = resp.json()
     if isinstance(sessions, list) and sessions:
         return sessions[0]
     return None
 
 
 async def send_and_stream(
+    client: httpx.AsyncClient,
     *,
-    base_url: str,
     message: str,
     session_id: Optional[str],
     cwd: Optional[str],
-    auth: httpx.Auth,
     connection_name: str,
 ) -> tuple[Optional[str], int]:
     """
@@ -113,8 +89,6 @@ async def send_and_stream(
     if cwd:
         payload["cwd"] = cwd
 
-    url = f"{base_url.rstrip('/')}/chat"
-
     print(f"\n[{connection_name}] Sending: {message}")
     if session_id:
         print(f"[{connection_name}] Session ID: {session_id}")
@@ -122,66 +96,49 @@ async def send_and_stream(
     token_count = 0
     captured_session_id = session_id
 
-    async with httpx.AsyncClient(timeout=None, auth=auth) as client:
-        async with client.stream("POST", url, json=payload) as resp:
-            resp.raise_for_status()
-
-            run_id = resp.headers.get("X-Claude-Run-Id")
-            print(f"[{connection_name}] Run ID: {run_id}")
-            print(f"[{connection_name}] Streaming...\n")
-
-            event_type: Optional[str] = None
-
-            async for raw_line in resp.aiter_lines():
-                if raw_line is None:
-                    continue
-                line = raw_line.strip()
-                if not line:
-                    continue
+    async with client.stream("POST", "/chat", json=payload) as resp:
+        resp.raise_for_status()
 
-                if line.startswith("event:"):
-                    event_type = line.split("event:", 1)[1].strip()
-                    continue
+        run_id = resp.headers.get("X-Claude-Run-Id")
+        print(f"[{connection_name}] Run ID: {run_id}")
+        print(f"[{connection_name}] Streaming...\n")
 
-                if not line.startswith("data:"):
-                    continue
+        tokens = TokenWriter()
+        async for event_type, data_obj in iter_sse(resp):
+            if event_type == "token" and isinstance(data_obj, dict):
+                text = data_obj.get("text", "")
+                tokens.write(text)
+                token_count += 1
+                continue
 
-                data_str = line.split("data:", 1)[1].strip()
-                try:
-                    data_obj = json.loads(data_str)
-                except json.JSONDecodeError:
-                    data_obj = data_str
+            tokens.flush()
 
-                if event_type == "session" and isinstance(data_obj, dict):
-                    captured_session_id = data_obj.get("session_id")
-                    is_new = data_obj.get("is_new", False)
-                    print(f"[{connection_name}:session] ID={captured_session_id}, new={is_new}")
+            if event_type == "session" and isinstance(data_obj, dict):
+                captured_session_id = data_obj.get("session_id")
+                is_new = data_obj.get("is_new", False)
+                print(f"[{connection_name}:session] ID={captured_session_id}, new={is_new}")
 
-                elif event_type == "token" and isinstance(data_obj, dict):
-                    text = data_obj.get("text", "")
-                    print(text, end="", flush=True)
-                    token_count += 1
+            elif event_type == "done":
+                print(f"\n[{connection_name}:done] Received {token_count} tokens")
+                break
 
-                elif event_type == "done":
-                    print(f"\n[{connection_name}:done] Received {token_count} tokens")
-                    break
+            elif event_type == "error" and isinstance(data_obj, dict):
+                print(f"\n[{connection_name}:error] {data_obj.get('message')}")
+                break
 
-                elif event_type == "error" and isinstance(data_obj, dict):
-                    print(f"\n[{connection_name}:error] {data_obj.get('message')}")
-                    break
+            elif event_type == "stopped":
+                print(f"\n[{connection_name}:stopped] Stream stopped")
+                break
 
-                elif event_type == "stopped":
-                    print(f"\n[{connection_name}:stopped] Stream stopped")
-                    break
+        tokens.flush()
 
     return captured_session_id, token_count
 
 
 async def test_continuous_messaging(
+    client: httpx.AsyncClient,
     *,
-    base_url: str,
     cwd: str,
-    auth: httpx.Auth,
     first_message: str,
     second_message: str,
     tokens_before_interrupt: int,
@@ -204,81 +161,64 @@ async def test_continuous_messaging(
 
     # Payload for first message
     payload = {"message": first_message, "cwd": cwd}
-    url = f"{base_url.rstrip('/')}/chat"
 
     print("\n[STEP 1] Starting first message stream...")
 
     token_count = 0
-    async with httpx.AsyncClient(timeout=None, auth=auth) as client:
-        async with client.stream("POST", url, json=payload) as resp:
-            resp.raise_for_status()
-
-            run_id = resp.headers.get("X-Claude-Run-Id")
-            print(f"[conn-1] Run ID: {run_id}")
-            print("[conn-1] Streaming response...\n")
-
-            event_type: Optional[str] = None
-
-            async for raw_line in resp.aiter_lines():
-                if raw_line is None:
-                    continue
-                line = raw_line.strip()
-                if not line:
-                    continue
-
-                if line.startswith("event:"):
-                    event_type = line.split("event:", 1)[1].strip()
-                    continue
-
-                if not line.startswith("data:"):
-                    continue
-
-                data_str = line.split("data:", 1)[1].strip()
-                try:
-                    data_obj = json.loads(data_str)
-                except json.JSONDecodeError:
-                    data_obj = data_str
-
-                if event_type == "session" and isinstance(data_obj, dict):
-                    session_id = data_obj.get("session_id")
-                    is_new = data_obj.get("is_new", False)
-                    print(f"[conn-1:session] ID={session_id}, new={is_new}")
-
-                elif event_type == "token" and isinstance(data_obj, dict):
-                    text = data_obj.get("text", "")
-                    print(text, end="", flush=True)
-                    token_count += 1
-
-                    # Send second message after receiving enough tokens
-                    if not second_message_sent and token_count >= tokens_before_interrupt:
-                        second_message_sent = True
-                        print("\n\n" + "*" * 70)
-                        print("[STEP 2] !!! SENDING SECOND MESSAGE WHILE FIRST IS STREAMING !!!")
-                        print("*" * 70)
-
-                        # Create async task to send second message in parallel
-                        second_stream_task = asyncio.create_task(
-                            send_and_stream(
-                                base_url=base_url,
-                                message=second_message,
-                                session_id=session_id,
-                                cwd=None,  # Use session's cwd
-                                auth=auth,
-                                connection_name="conn-2",
-                            )
+    async with client.stream("POST", "/chat", json=payload) as resp:
+        resp.raise_for_status()
+
+        run_id = resp.headers.get("X-Claude-Run-Id")
+        print(f"[conn-1] Run ID: {run_id}")
+        print("[conn-1] Streaming response...\n")
+
+        tokens = TokenWriter()
+        async for event_type, data_obj in iter_sse(resp):
+            if event_type == "token" and isinstance(data_obj, dict):
+                text = data_obj.get("text", "")
+                tokens.write(text)
+                token_count += 1
+
+                # Send second message after receiving enough tokens
+                if not second_message_sent and token_count >= tokens_before_interrupt:
+                    second_message_sent = True
+                    tokens.flush()
+                    print("\n\n" + "*" * 70)
+                    print("[STEP 2] !!! SENDING SECOND MESSAGE WHILE FIRST IS STREAMING !!!")
+                    print("*" * 70, flush=True)
+
+                    # Create async task to send second message in parallel
+                    second_stream_task = asyncio.create_task(
+                        send_and_stream(
+                            client,
+                            message=second_message,
+                            session_id=session_id,
+                            cwd=None,  # Use session's cwd
+                            connection_name="conn-2",
                         )
+                    )
+                continue
 
-                elif event_type == "done":
-                    print(f"\n[conn-1:done] First stream complete. Tokens: {token_count}")
-                    break
+            tokens.flush()
 
-                elif event_type == "error" and isinstance(data_obj, dict):
-                    print(f"\n[conn-1:error] {data_obj.get('message')}")
-                    break
+            if event_type == "session" and isinstance(data_obj, dict):
+                session_id = data_obj.get("session_id")
+                is_new = data_obj.get("is_new", False)
+                print(f"[conn-1:session] ID={session_id}, new={is_new}")
 
-                elif event_type == "stopped":
-                    print(f"\n[conn-1:stopped] First stream stopped")
-                    break
+            elif event_type == "done":
+                print(f"\n[conn-1:done] First stream complete. Tokens: {token_count}")
+                break
+
+            elif event_type == "error" and isinstance(data_obj, dict):
+                print(f"\n[conn-1:error] {data_obj.get('message')}")
+                break
+
+            elif event_type == "stopped":
+                print(f"\n[conn-1:stopped] First stream stopped")
+                break
+
+        tokens.flush()
 
     # Wait for second stream to complete
     if second_stream_task:
@@ -301,10 +241,16 @@ async def test_continuous_messaging(
 async def main_async() -> None:
     args = build_parser().parse_args()
     auth = httpx.BasicAuth(args.username, args.password)
+    # The cwd lookup and both streams share one connection pool instead of each
+    # opening their own client.
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=None, auth=auth) as client:
+        await run_test(client, args)
 
+
+async def run_test(client: httpx.AsyncClient, args: argparse.Namespace) -> None:
     cwd = args.cwd
     if cwd is None:
-        default_session = await fetch_default_session(args.base_url, auth)
+        default_session = await fetch_default_session(client)
         if default_session and isinstance(default_session.get("cwd"), str):
             cwd = default_session["cwd"]
             print(f"[info] Using cwd from existing session: {cwd}")
@@ -313,9 +259,8 @@ async def main_async() -> None:
             print(f"[info] Using project root as cwd: {cwd}")
 
     await test_continuous_messaging(
-        base_url=args.base_url,
+        client,
         cwd=cwd,
-        auth=auth,
         first_message=args.first_message,
         second_message=args.second_message,
         tokens_before_interrupt=args.tokens_before_interrupt,
@@ -323,7 +268,12 @@ async def main_async() -> None:
 
 
 def main() -> None:
-    asyncio.run(main_async())
+    # Same as the server: use uvloop when it is installed (it is POSIX-only).
+    try:
+        from uvloop import run
+    except ImportError:
+        run = asyncio.run
+    run(main_async())
 
 
 if __name__ == "__main__":
@@ -6,12 +6,12 @@ This tests the TRUE continuous messaging capability.
 from __future__ import annotations
 
 import asyncio
-import json
 import sys
-from pathlib import Path
 
 import httpx
-import yaml
+
+from _config import PROJECT_ROOT, load_default_auth
+from _sse import TokenWriter, iter_sse
 
 # Fix Windows console encoding issues
 if sys.platform == "win32":
@@ -21,28 +21,7 @@ if sys.platform == "win32":
     except AttributeError:
         pass
 
-PROJECT_ROOT = Path(__file__).resolve().parent.parent
-CONFIG_PATH = PROJECT_ROOT / "config.yaml"
-
-
-def _load_default_auth() -> tuple[str, str]:
-    try:
-        with CONFIG_PATH.open("r", encoding="utf-8") as handler:
-            data = yaml.safe_load(handler) or {}
-    except (FileNotFoundError, yaml.YAMLError):
-        data = {}
-
-    if isinstance(data, dict):
-        users = data.get("users")
-        if isinstance(users, dict):
-            for username, password in users.items():
-                if isinstance(username, str) and isinstance(password, str):
-                    return username, password
-
-    return "admin", "642531"
-
-
-DEFAULT_USERNAME, DEFAULT_PASSWORD = _load_default_auth()
+DEFAULT_USERNAME, DEFAULT_PASSWORD = load_default_auth()
 
 
 async def test_interrupt():
@@ -68,6 +47,7 @@ async def test_interrupt():
     run_id_1 = None
     token_count_1 = 0
     second_message_sent = False
+    second_stream_task = None
 
     async with httpx.AsyncClient(timeout=None, auth=auth) as client:
         print("[STEP 1] Sending first message (expecting long response)...")
@@ -78,42 +58,20 @@ async def test_interrupt():
             run_id_1 = resp1.headers.get("X-Claude-Run-Id")
             print(f"Run ID: {run_id_1}\n")
 
-            event_type = None
-            async for raw_line in resp1.aiter_lines():
-                if not raw_line:
-                    continue
-                line = raw_line.strip()
-                if not line:
-                    continue
-
-                if line.startswith("event:"):
-                    event_type = line.split("event:", 1)[1].strip()
-                    continue
-
-                if not line.startswith("data:"):
-                    continue
-
-                data_str = line.split("data:", 1)[1].strip()
-                try:
-                    data_obj = json.loads(data_str)
-                except json.JSONDecodeError:
-                    data_obj = data_str
-
-                if event_type == "session" and isinstance(data_obj, dict):
-                    session_id = data_obj.get("session_id")
-                    print(f"[session] ID={session_id}\n")
-
-                elif event_type == "token" and isinstance(data_obj, dict):
+            tokens = TokenWriter()
+            async for event_type, data_obj in iter_sse(resp1):
+                if event_type == "token" and isinstance(data_obj, dict):
                     text = data_obj.get("text", "")
-                    print(text, end="", flush=True)
+                    tokens.write(text)
                     token_count_1 += 1
 
                     # After receiving some tokens, send second message!
                     if not second_message_sent and token_count_1 >= 30:
                         second_message_sent = True
+                        tokens.flush()
                         print("\n\n" + "*"*70)
                         print("* [STEP 2] INTERRUPTING! Sending second message NOW!")
-                        print("*"*70 + "\n")
+                        print("*"*70 + "\n", flush=True)
 
                         # Send second message in parallel
                         payload2 = {
@@ -121,7 +79,16 @@ async def test_interrupt():
                             "session_id": session_id
                         }
 
-                        asyncio.create_task(send_second_message(client, url, payload2))
+                        second_stream_task = asyncio.create_task(
+                            send_second_message(client, url, payload2)
+                        )
+                    continue
+
+                tokens.flush()
+
+                if event_type == "session" and isinstance(data_obj, dict):
+                    session_id = data_obj.get("session_id")
+                    print(f"[session] ID={session_id}\n")
 
                 elif event_type == "done":
                     print(f"\n\n[done] First stream complete. Tokens: {token_count_1}")
@@ -131,6 +98,12 @@ async def test_interrupt():
                     print(f"\n[error] {data_obj.get('message') if isinstance(data_obj, dict) else data_obj}")
                     break
 
+            tokens.flush()
+
+        # The second stream shares this client, so let it finish before closing it.
+        if second_stream_task is not None:
+            await second_stream_task
+
     print("\n" + "="*70)
     print("[SUCCESS] Test completed!")
     print(f"Session ID: {session_id}")
@@ -149,35 +122,19 @@ async def send_second_message(client: httpx.AsyncClient, url: str, payload: dict
             print(f"[conn-2] Run ID: {run_id}")
             print(f"[conn-2] Streaming response:\n")
 
-            event_type = None
             token_count = 0
 
-            async for raw_line in resp2.aiter_lines():
-                if not raw_line:
-                    continue
-                line = raw_line.strip()
-                if not line:
-                    continue
-
-                if line.startswith("event:"):
-                    event_type = line.split("event:", 1)[1].strip()
-                    continue
-
-                if not line.startswith("data:"):
-                    continue
-
-                data_str = line.split("data:", 1)[1].strip()
-                try:
-                    data_obj = json.loads(data_str)
-                except json.JSONDecodeError:
-                    data_obj = data_str
-
+            tokens = TokenWriter()
+            async for event_type, data_obj in iter_sse(resp2):
                 if event_type == "token" and isinstance(data_obj, dict):
                     text = data_obj.get("text", "")
-                    print(text, end="", flush=True)
+                    tokens.write(text)
                     token_count += 1
+                    continue
 
-                elif event_type == "done":
+                tokens.flush()
+
+                if event_type == "done":
                     print(f"\n\n[conn-2:done] Second stream complete! Tokens: {token_count}\n")
                     break
 
@@ -185,9 +142,16 @@ async def send_second_message(client: httpx.AsyncClient, url: str, payload: dict
                     print(f"\n[conn-2:error] {data_obj.get('message') if isinstance(data_obj, dict) else data_obj}\n")
                     break
 
+            tokens.flush()
+
     except Exception as e:
         print(f"\n[conn-2:exception] {e}\n")
 
 
 if __name__ == "__main__":
-    asyncio.run(test_interrupt())
+    # Same as the server: use uvloop when it is installed (it is POSIX-only).
+    try:
+        from uvloop import run
+    except ImportError:
+        run = asyncio.run
+    run(test_interrupt())
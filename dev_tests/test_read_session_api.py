@@ -30,6 +30,8 @@ import yaml
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 CONFIG_PATH = PROJECT_ROOT / "config.yaml"
+# Prefer the libyaml-backed loader; fall back when PyYAML was built without it.
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 
 def load_app_config() -> dict:
@@ -39,7 +41,7 @@ def load_app_config() -> dict:
     }
     try:
         with CONFIG_PATH.open("r", encoding="utf-8") as handler:
-            data = yaml.safe_load(handler) or {}
+            data = yaml.load(handler, Loader=_YAML_LOADER) or {}
     except FileNotFoundError:
         data = {}
     except yaml.YAMLError:
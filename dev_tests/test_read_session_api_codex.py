@@ -6,28 +6,20 @@ import argparse
 import json
 import sqlite3
 from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
+from typing import Iterable
 
 import httpx
-import yaml
 
-
-PROJECT_ROOT = Path(__file__).resolve().parent.parent
-CONFIG_PATH = PROJECT_ROOT / "config.yaml"
+from _config import CONFIG_PATH, PROJECT_ROOT, load_config, load_default_auth
 
 
 def load_app_config() -> dict:
     defaults = {
         "sessions_db": str(PROJECT_ROOT / "sessions.db"),
     }
-    try:
-        with CONFIG_PATH.open("r", encoding="utf-8") as handler:
-            data = yaml.safe_load(handler) or {}
-    except FileNotFoundError:
-        data = {}
-    except yaml.YAMLError:
-        data = {}
-
+    data = load_config()
     if not isinstance(data, dict):
         data = {}
 
@@ -46,16 +38,7 @@ if not _db_path.is_absolute():
 DB_PATH = _db_path
 
 
-def _default_auth() -> tuple[str, str]:
-    users = CONFIG.get("users")
-    if isinstance(users, dict):
-        for username, password in users.items():
-            if isinstance(username, str) and isinstance(password, str):
-                return username, password
-    return "admin", "642531"
-
-
-DEFAULT_USERNAME, DEFAULT_PASSWORD = _default_auth()
+DEFAULT_USERNAME, DEFAULT_PASSWORD = load_default_auth()
 
 
 def _dt_to_str(dt: datetime) -> str:
@@ -64,32 +47,35 @@ def _dt_to_str(dt: datetime) -> str:
     return dt.astimezone(timezone.utc).isoformat()
 
 
-def ensure_codex_session_metadata(session_id: str, title: str, cwd: str) -> None:
+@lru_cache(maxsize=1)
+def _get_conn() -> sqlite3.Connection:
+    """Open sessions.db once, in autocommit mode with the server's WAL settings."""
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS codex_sessions (
-                session_id TEXT PRIMARY KEY,
-                title TEXT NOT NULL,
-                cwd TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL
-            )
-            """
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS codex_sessions (
+            session_id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            cwd TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
         )
+        """
+    )
+    return conn
 
-        now = datetime.now(timezone.utc)
-        payload = (
-            session_id,
-            title,
-            cwd,
-            _dt_to_str(now),
-            _dt_to_str(now),
-        )
 
-        conn.execute(
+def ensure_codex_session_metadata_many(rows: Iterable[tuple[str, str, str]]) -> None:
+    """Upsert (session_id, title, cwd) rows in a single transaction."""
+    now = _dt_to_str(datetime.now(timezone.utc))
+    conn = _get_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
             """
             INSERT INTO codex_sessions (session_id, title, cwd, created_at, updated_at)
             VALUES (?, ?, ?, ?, ?)
@@ -98,30 +84,32 @@ def ensure_codex_session_metadata(session_id: str, title: str, cwd: str) -> None
                 cwd = excluded.cwd,
                 updated_at = excluded.updated_at
             """,
-            payload,
+            [(session_id, title, cwd, now, now) for session_id, title, cwd in rows],
         )
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
 
-        conn.commit()
-    finally:
-        conn.close()
+
+def ensure_codex_session_metadata(session_id: str, title: str, cwd: str) -> None:
+    ensure_codex_session_metadata_many([(session_id, title, cwd)])
 
 
-def fetch_codex_session_detail(base_url: str, session_id: str, auth: httpx.Auth) -> dict:
-    url = f"{base_url.rstrip('/')}/codex/sessions/{session_id}"
-    resp = httpx.get(url, timeout=30.0, auth=auth)
+def fetch_codex_session_detail(client: httpx.Client, session_id: str) -> dict:
+    resp = client.get(f"/codex/sessions/{session_id}")
     resp.raise_for_status()
     return resp.json()
 
 
-def fetch_codex_session_list(base_url: str, auth: httpx.Auth) -> list[dict]:
-    url = f"{base_url.rstrip('/')}/codex/sessions"
-    resp = httpx.get(url, timeout=30.0, auth=auth)
+def fetch_codex_session_list(client: httpx.Client) -> list[dict]:
+    resp = client.get("/codex/sessions")
     resp.raise_for_status()
     return resp.json()
 
 
-def fetch_default_session_summary(base_url: str, auth: httpx.Auth) -> dict | None:
-    sessions = fetch_codex_session_list(base_url, auth)
+def fetch_default_session_summary(client: httpx.Client) -> dict | None:
+    sessions = fetch_codex_session_list(client)
     if isinstance(sessions, list) and sessions:
         return sessions[0]
     return None
@@ -139,13 +127,19 @@ def main() -> None:
     args = parser.parse_args()
 
     auth = httpx.BasicAuth(args.username, args.password)
+    # 列表与详情请求复用同一个连接
+    with httpx.Client(base_url=args.base_url.rstrip("/"), auth=auth, timeout=30.0) as client:
+        run_smoke_test(client, args)
+
+
+def run_smoke_test(client: httpx.Client, args: argparse.Namespace) -> None:
     session_id = args.session_id
     cwd = args.cwd
 
     default_session: dict | None = None
     if session_id is None or cwd is None:
         try:
-            default_session = fetch_default_session_summary(args.base_url, auth)
+            default_session = fetch_default_session_summary(client)
         except httpx.HTTPError as exc:
             print(f"⚠️ 无法通过 /codex/sessions 获取默认会话: {exc}")
 
@@ -166,7 +160,7 @@ def main() -> None:
     ensure_codex_session_metadata(session_id, args.title, cwd)
     print(f"✔️ 已确保 codex_sessions 表中存在元信息: {session_id}")
 
-    detail = fetch_codex_session_detail(args.base_url, session_id, auth)
+    detail = fetch_codex_session_detail(client, session_id)
     print("/codex/sessions/{id} 返回:")
     print(f"  标题: {detail['title']}")
     print(f"  cwd: {detail['cwd']}")
@@ -174,7 +168,7 @@ def main() -> None:
     print("  完整消息 JSON:")
     print(json.dumps(detail, ensure_ascii=False, indent=2))
 
-    session_list = fetch_codex_session_list(args.base_url, auth)
+    session_list = fetch_codex_session_list(client)
     summary = next((item for item in session_list if item["session_id"] == session_id), None)
     if summary:
         print("/codex/sessions 列表中找到该会话:")